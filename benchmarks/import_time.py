@@ -0,0 +1,97 @@
+import os
+import sys
+import time
+import getopt
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# builds one motion frame, runs it through the sample App and packs the result
+FIRST_PREDICTION = """
+import time
+start = time.perf_counter()
+import struct
+from server import App
+from predict_server._types import MotionData, PredictedData
+imported = time.perf_counter()
+
+pose = [0.0] * 6 + [0.0, 0.0, 0.0, 1.0] + [0.0] * 6 + [-1.0, 1.0, 1.0, -1.0] + [0.0] * 3 + [0.0, 0.0, 0.0, 1.0] + [0.0] * 6
+frame = struct.pack('>q33fB', 0, *pose, 0)
+motion_data = MotionData.from_bytes(frame)
+result = App().predict(motion_data)
+PredictedData(motion_data.timestamp, result[0], motion_data.left_eye_position, motion_data.right_eye_position,
+              motion_data.head_orientation, motion_data.camera_projection, motion_data.right_hand_position,
+              motion_data.right_hand_orientation, *result[1:], 0, False, False).pack()
+predicted = time.perf_counter()
+
+print((imported - start) * 1000, (predicted - start) * 1000)
+"""
+
+
+def import_breakdown(module):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + module],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+
+    # "import time: self [us] | cumulative | imported package", nesting shown by indentation
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((depth, int(cumulative), name.strip()))
+
+    return entries
+
+
+def main():
+    module = "predict_server"
+    count = 15
+    runs = 5
+
+    try:
+        opts, _args = getopt.getopt(sys.argv[1:], "m:n:r:")
+    except getopt.GetoptError as err:
+        print(err)
+        sys.exit(1)
+
+    for opt, arg in opts:
+        if opt == "-m":
+            module = arg
+        elif opt == "-n":
+            count = int(arg)
+        elif opt == "-r":
+            runs = int(arg)
+        else:
+            assert False, "unhandled option"
+
+    entries = import_breakdown(module)
+    top_level = [entry for entry in entries if entry[0] <= 1]
+
+    print("import {}: {:.1f} ms".format(module, top_level[-1][1] / 1000))
+    for _depth, cumulative, name in sorted(top_level[:-1], key=lambda entry: -entry[1])[:count]:
+        print("  {:>8.1f} ms  {}".format(cumulative / 1000, name))
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-c", FIRST_PREDICTION],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        )
+        process = (time.perf_counter() - start) * 1000
+
+        imported, predicted = (float(value) for value in result.stdout.split())
+        timings.append((imported, predicted, process))
+
+    timings.sort(key=lambda timing: timing[1])
+    imported, predicted, process = timings[len(timings) // 2]
+    print("cold start (median of {}): import {:.1f} ms, first prediction {:.1f} ms, "
+          "whole process {:.1f} ms".format(runs, imported, predicted, process))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import sys
 import math
 import asyncio
 import zmq
@@ -8,14 +9,36 @@ from ._motion_data_transport import MotionDataTransport
 from ._feedback_analyser import FeedbackAnalyser
 from ._external_input import ExternalInput
 from ._writer import PredictionOutputWriter, PerfMetricWriter, GameEventWriter
-from ._prediction import BufferedNoPrediction
-
-
+from ._prediction import BufferedNoPrediction, EchoPrediction, \
+    OneEuroFilter, ConstantVelocityKalmanFilter, SlerpFilter, FilteredPrediction
+from ._transport import TRANSPORTS, SharedMemoryRing, make_endpoint
+from ._traffic_log import TrafficRecorder, read_traffic_log
+from ._recording import RecordingReader, RecordingWriter, convert_csv_recording
+from ._control import ControlInput
+from ._hot_swap import ModuleHotSwap, load_module
+from ._deadline import PredictionDeadline
+from ._shadow import ShadowEvaluator
+from ._prediction_cache import PredictionCache
+from ._profiler import SlowFrameProfiler
+from ._trace import ChromeTraceWriter
+from ._metric_summary import DDSketch, MetricSummaryWriter
+from ._low_latency import LowLatencyMode
+from ._memory_monitor import MemoryMonitor
+from ._telemetry import TelemetryPublisher, TOPIC_FEEDBACK, TOPIC_LATENCY, TOPIC_GAME_EVENT, TOPIC_MEMORY, LATENCY_FORMAT
+
+
+# threading: without a prediction deadline every method runs on the event loop thread. With one,
+# predict and predict_batch run on a single worker thread, one call at a time, while the other
+# callbacks keep running on the loop thread, so state shared with the predictions needs a lock.
 class PredictModule(metaclass=ABCMeta):
     @abstractmethod
     def predict(self, motion_data):
         pass
 
+    def predict_batch(self, motion_data_list):
+        # override to predict all frames gathered in a batching window at once
+        return [self.predict(motion_data) for motion_data in motion_data_list]
+
     @abstractmethod
     def feedback_received(self, feedback):
         pass
@@ -24,41 +47,98 @@ class PredictModule(metaclass=ABCMeta):
     def external_input_received(self, input_data):
         pass
 
+    def external_inputs_received(self, input_data_list):
+        # override to handle all input changes drained in one tick at once
+        for input_data in input_data_list:
+            self.external_input_received(input_data)
+
     @abstractmethod
     def game_event_received(self, event):
         pass
 
 
 class MotionPredictServer:
-    def __init__(self, module, port_input, port_feedback, prediction_output, metric_output, game_event_output, accept_client_buttons):
+    def __init__(self, module, port_input, port_feedback, prediction_output, metric_output, game_event_output, accept_client_buttons, transport='tcp', traffic_capture=None,
+                 control=False, swap_latency_budget=None, prediction_deadline=None, fallback_module=None,
+                 shadow_modules=None, shadow_output="shadow", batch_size=1, batch_window=1.0, extended_inputs=False,
+                 prediction_cache=None, telemetry=False, profile_threshold=None, profile_output="profile",
+                 trace_output=None, output_rotation=None, low_latency=None, summary_output=None, summary_interval=1.0,
+                 memory_interval=None, memory_output="memory", control_host="127.0.0.1"):
+        assert(transport in TRANSPORTS)
+
         self.module = module
         self.port_input = port_input
         self.port_feedback = port_feedback
         self.accept_client_buttons = accept_client_buttons
+        self.transport = transport
+        self.control = control
+        self.control_host = control_host
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.extended_inputs = extended_inputs
+        self.prediction_cache = prediction_cache
+        self.telemetry = telemetry
+        self.profile_threshold = profile_threshold
+        self.low_latency = low_latency
+        self.memory_interval = memory_interval
 
         self.external_input = ExternalInput(self)
         self.motion_data_transport = MotionDataTransport(self)
         self.feedback_analyser = FeedbackAnalyser(self)        
+        self.control_input = ControlInput(self)
+        self.telemetry_publisher = TelemetryPublisher(self) if telemetry else None
+        self.hot_swap = ModuleHotSwap(self, swap_latency_budget)
+
+        self.prediction_deadline = PredictionDeadline(
+            prediction_deadline, fallback_module
+        ) if prediction_deadline is not None else None
+
+        self.shadow_evaluator = ShadowEvaluator(
+            shadow_modules, shadow_output
+        ) if shadow_modules else None
+
+        # can also be toggled at runtime through the control socket
+        self.profiler = SlowFrameProfiler(
+            profile_threshold if profile_threshold is not None else 5.0, profile_output
+        )
+
+        # can also be switched on and to deep mode through the control socket
+        self.memory_monitor = MemoryMonitor(
+            self, memory_interval if memory_interval is not None else 10.0, memory_output
+        )
 
         self.prediction_output = PredictionOutputWriter(
-            prediction_output
+            prediction_output, output_rotation
         ) if prediction_output is not None else None
         
         self.metric_writer = PerfMetricWriter(
-            metric_output
+            metric_output, output_rotation
         ) if metric_output is not None else None
 
+        self.summary_writer = MetricSummaryWriter(
+            summary_output, summary_interval, rotation=output_rotation
+        ) if summary_output is not None else None
+
         self.game_event_writer = GameEventWriter(
-            game_event_output
+            game_event_output, output_rotation
         ) if game_event_output is not None else None
 
+        self.traffic_recorder = TrafficRecorder(
+            traffic_capture
+        ) if traffic_capture is not None else None
+
+        self.trace_writer = ChromeTraceWriter(
+            trace_output
+        ) if trace_output is not None else None
+
     def run(self):
-        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+        if sys.platform == 'win32':
+            asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
         context = Context.instance()
         self.event_loop = asyncio.get_event_loop()
 
-        print("Starting server on port {}...".format(self.port_input), flush=True)
+        print("Starting server on port {} ({})...".format(self.port_input, self.transport), flush=True)
 
         try:
             self.event_loop.run_until_complete(self.loop(context))
@@ -68,40 +148,177 @@ class MotionPredictServer:
             self.shutdown()
 
     def shutdown(self):
-        self.event_loop.close()
+        self.close_event_loop()
 
-        if self.prediction_output is not None:
-            self.prediction_output.close()
+        steps = [self.motion_data_transport.close, self.profiler.close, self.memory_monitor.close]
 
-        if self.metric_writer is not None:
-            self.metric_writer.close()
+        if self.low_latency is not None:
+            steps.append(self.low_latency.report)
 
-        if self.game_event_writer is not None:
-            self.game_event_writer.close()
+        if self.prediction_deadline is not None:
+            steps += [self.prediction_deadline.report, self.prediction_deadline.close]
+
+        if self.prediction_cache is not None:
+            steps.append(self.prediction_cache.report)
+
+        for component in (self.shadow_evaluator, self.prediction_output, self.telemetry_publisher,
+                          self.metric_writer, self.summary_writer, self.trace_writer,
+                          self.game_event_writer, self.traffic_recorder):
+            if component is not None:
+                steps.append(component.close)
+
+        # every step runs even when an earlier one fails, so that all outputs get flushed
+        error = None
+        for step in steps:
+            try:
+                step()
+            except Exception as e:
+                print("shutdown: {} failed: {!r}".format(step.__qualname__, e), flush=True)
+                error = error or e
+
+        if error is not None:
+            raise error
+
+    def close_event_loop(self):
+        # the profiler and memory monitor tasks are still scheduled after an interrupt
+        pending = asyncio.all_tasks(self.event_loop)
+        for task in pending:
+            task.cancel()
+
+        self.event_loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        self.event_loop.close()
 
     async def loop(self, context):
         poller = Poller()
-        self.external_input.configure(context, poller, self.port_input + 2)
-        self.motion_data_transport.configure(context, poller, self.port_input, self.port_input + 1, self.accept_client_buttons)
-        self.feedback_analyser.configure(context, poller, self.port_feedback)
+        self.external_input.configure(context, poller, make_endpoint(self.transport, self.port_input + 2))
+        self.feedback_analyser.configure(context, poller, make_endpoint(self.transport, self.port_feedback))
+
+        if self.control:
+            self.control_input.configure(context, poller, make_endpoint(
+                self.transport, self.port_input + 3, self.control_host
+            ))
+
+        if self.telemetry_publisher is not None:
+            self.telemetry_publisher.configure(context, make_endpoint(self.transport, self.port_input + 4))
+
+        if self.transport == 'shm':
+            self.motion_data_transport.configure_shared_memory(
+                "predict_server-" + str(self.port_input), self.accept_client_buttons, self.extended_inputs
+            )
+        else:
+            self.motion_data_transport.configure(
+                context, poller,
+                make_endpoint(self.transport, self.port_input),
+                make_endpoint(self.transport, self.port_input + 1),
+                self.accept_client_buttons
+            )
+
+        self.motion_data_transport.configure_batching(self.batch_size, self.batch_window)
+        self.motion_data_transport.extended_inputs = self.extended_inputs
+
+        # the shared memory ring cannot wake the poller, so keep spinning over it
+        timeout = 0 if self.transport == 'shm' else 100
+
+        if self.profile_threshold is not None:
+            self.profiler.enable()
+
+        if self.memory_interval is not None:
+            self.memory_monitor.enable()
+
+        if self.low_latency is not None:
+            self.low_latency.apply()
+
+        if self.summary_writer is not None:
+            self.check_summary()
 
         while True:
-            events = await poller.poll(100)
+            if self.low_latency is not None:
+                events = await self.low_latency.poll(
+                    poller, self.motion_data_transport.socket_recv, self.motion_data_transport.ring_recv
+                )
+            else:
+                events = await poller.poll(timeout)
             
             await self.external_input.process_events(events)
             await self.motion_data_transport.process_events(events, self.external_input)
             await self.feedback_analyser.process_events(events)
+            await self.control_input.process_events(events)
+
+    def check_summary(self):
+        self.summary_writer.check()
+        self.event_loop.call_later(self.summary_writer.interval, self.check_summary)
+
+    def record_traffic(self, channel, frame):
+        if self.traffic_recorder is None:
+            return
+
+        self.traffic_recorder.record(channel, frame)
 
     # for motion data transport
     def pre_predict_motion(self, session):
+        self.profiler.frame_started(session)
         self.feedback_analyser.start_prediction(session)
 
-    def predict_motion(self, motion_data):
-        return self.module.predict(motion_data)
+    async def predict_motion(self, motion_data):
+        if self.prediction_cache is None:
+            return await self.predict_motion_uncached(motion_data)
+
+        key = self.prediction_cache.make_key(motion_data)
+        result = self.prediction_cache.lookup(self.module, key)
+        if result is None:
+            result = await self.predict_motion_uncached(motion_data)
+
+            # a fallback result stands in for a missed deadline and is not reused
+            if self.prediction_deadline is None or not self.prediction_deadline.missed:
+                self.prediction_cache.store(key, result)
+
+        return result
+
+    async def predict_motion_uncached(self, motion_data):
+        if self.prediction_deadline is None:
+            return self.hot_swap.predict(motion_data)
+
+        return await self.prediction_deadline.predict(
+            self.hot_swap.predict, type(self.module).__name__, motion_data
+        )
+
+    async def predict_motion_batch(self, motion_data_list):
+        if self.prediction_cache is None:
+            return await self.predict_motion_batch_uncached(motion_data_list)
+
+        keys = [self.prediction_cache.make_key(motion_data) for motion_data in motion_data_list]
+        results = [self.prediction_cache.lookup(self.module, key) for key in keys]
+
+        missed = [index for index, result in enumerate(results) if result is None]
+        if len(missed) > 0:
+            predicted = await self.predict_motion_batch_uncached([motion_data_list[index] for index in missed])
+            for index, result in zip(missed, predicted):
+                results[index] = result
+
+                if self.prediction_deadline is None or not self.prediction_deadline.missed:
+                    self.prediction_cache.store(keys[index], result)
+
+        return results
+
+    async def predict_motion_batch_uncached(self, motion_data_list):
+        if self.prediction_deadline is None:
+            return self.hot_swap.predict_batch(motion_data_list)
+
+        return await self.prediction_deadline.predict_batch(
+            self.hot_swap.predict_batch, type(self.module).__name__, motion_data_list
+        )
 
     def post_predict_motion(self, session):
         self.feedback_analyser.end_prediction(session)
 
+    def prediction_sent(self, motion_data, predicted_data):
+        if self.shadow_evaluator is not None:
+            self.shadow_evaluator.submit(motion_data, predicted_data)
+
+        self.write_prediction_output(motion_data, predicted_data)
+
+        self.profiler.frame_finished()
+
     def write_prediction_output(self, motion_data, predicted_data):
         if self.prediction_output is None:
             return
@@ -111,15 +328,83 @@ class MotionPredictServer:
     def feedback_received(self, feedback):
         self.module.feedback_received(feedback)
 
+        if self.shadow_evaluator is not None:
+            self.shadow_evaluator.feedback_received(feedback)
+
+        if self.telemetry_publisher is not None:
+            self.telemetry_publisher.publish_feedback(feedback)
+
         if self.metric_writer is not None:
             self.metric_writer.write_metric(feedback)
 
+        if self.summary_writer is not None:
+            self.summary_writer.write_metric(feedback)
+
+        if self.trace_writer is not None:
+            self.trace_writer.write_feedback(feedback)
+
     def external_input_received(self, input_data):
         self.module.external_input_received(input_data)
 
+        if self.shadow_evaluator is not None:
+            self.shadow_evaluator.external_input_received(input_data)
+
+    def external_inputs_received(self, input_data_list):
+        self.module.external_inputs_received(input_data_list)
+
+        if self.shadow_evaluator is not None:
+            self.shadow_evaluator.external_inputs_received(input_data_list)
+
+    def control_received(self, command, argument):
+        if command == 'swap':
+            self.hot_swap.request(argument)
+        elif command == 'profile':
+            self.profiler.control(argument)
+        elif command == 'memory':
+            self.memory_monitor.control(argument)
+        else:
+            print("unknown control command: " + command, flush=True)
+
+    def memory_tables(self):
+        # entry counts of the tables that grow with traffic
+        tables = {
+            'feedbacks': len(self.feedback_analyser.feedbacks),
+            'external_inputs_known': len(self.external_input.states) - self.external_input.states.count(0),
+            'external_input_devices': len(self.external_input.device_masks),
+            'prediction_history': len(self.hot_swap.history),
+            'clock_sync_samples': len(self.feedback_analyser.clock_sync.samples),
+            'slow_frames': len(self.profiler.records)
+        }
+
+        if self.prediction_cache is not None:
+            tables['prediction_cache'] = len(self.prediction_cache.entries)
+
+        if self.shadow_evaluator is not None:
+            for runner in [self.shadow_evaluator.primary] + self.shadow_evaluator.shadows:
+                tables['shadow_' + runner.name] = len(runner.awaiting_motion) + len(runner.awaiting_feedback)
+
+        for name, writer in (('prediction_output', self.prediction_output),
+                             ('metric_output', self.metric_writer),
+                             ('summary_output', self.summary_writer),
+                             ('game_event_output', self.game_event_writer)):
+            if writer is not None:
+                tables[name + '_queued'] = writer.queued()
+
+        return tables
+
+    def memory_reported(self, record):
+        if self.telemetry_publisher is not None:
+            self.telemetry_publisher.publish_memory(record)
+
     def game_event_received(self, event):
         self.module.game_event_received(event)
 
+        if self.shadow_evaluator is not None:
+            self.shadow_evaluator.game_event_received(event)
+
+        if self.telemetry_publisher is not None:
+            self.telemetry_publisher.publish_game_event(event)
+
         if self.game_event_writer is not None:
             self.game_event_writer.write(event)
 
@@ -0,0 +1,48 @@
+import collections
+
+FEEDBACK_KEYS = ('gatherInput', 'startPrediction', 'stopPrediction', 'startSimulation', 'sendVideo', 'firstFrameReceived')
+
+
+class ClockSync:
+    # server clock = client clock + offset, estimated ntp style from the exchanges with the
+    # least round trip delay in a sliding window, as those carry the least queueing on either leg
+    def __init__(self, window=256, min_drift_samples=16):
+        self.samples = collections.deque(maxlen=window)  # (client time, offset, delay)
+        self.min_drift_samples = min_drift_samples
+        self.offset = None
+        self.offset_time = 0.0
+        self.drift = 0.0
+
+    def add_sample(self, client_send, server_receive, server_send, client_receive):
+        offset = ((server_receive - client_send) + (server_send - client_receive)) / 2
+        delay = (client_receive - client_send) - (server_send - server_receive)
+        self.samples.append((client_send, offset, delay))
+
+        # drift from the best exchanges of the older and the newer half of the window
+        half = len(self.samples) // 2
+        newest = min(list(self.samples)[half:], key=lambda sample: sample[2])
+        self.offset_time, self.offset = newest[0], newest[1]
+
+        if half >= self.min_drift_samples:
+            oldest = min(list(self.samples)[:half], key=lambda sample: sample[2])
+            if newest[0] != oldest[0]:
+                self.drift = (newest[1] - oldest[1]) / (newest[0] - oldest[0])
+
+    def offset_at(self, client_time):
+        return self.offset + self.drift * (client_time - self.offset_time)
+
+    def annotate(self, feedback):
+        if not all(key in feedback for key in FEEDBACK_KEYS):
+            return
+
+        # the motion data reached the server one prediction before the simulation started
+        prediction = feedback['stopPrediction'] - feedback['startPrediction']
+        self.add_sample(
+            feedback['gatherInput'],
+            feedback['startSimulation'] - prediction,
+            feedback['sendVideo'],
+            feedback['firstFrameReceived']
+        )
+
+        feedback['clockOffset'] = self.offset_at(feedback['gatherInput'])
+        feedback['clockDrift'] = self.drift
@@ -0,0 +1,22 @@
+import zmq
+
+class ControlInput:
+    def __init__(self, owner):
+        self.owner = owner
+        self.socket = None
+
+    def configure(self, context, poller, endpoint):
+        self.socket = context.socket(zmq.PULL)
+        self.socket.bind(endpoint)
+
+        poller.register(self.socket, zmq.POLLIN)
+
+    async def process_events(self, events):
+        if self.socket is None or self.socket not in dict(events):
+            return
+
+        # "<command> <argument>", e.g. "swap my_predictor:Predictor" or "profile on 5"
+        data = await self.socket.recv()
+        command, _, argument = data.decode('utf-8').strip().partition(' ')
+
+        self.owner.control_received(command, argument.strip())
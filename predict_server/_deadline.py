@@ -0,0 +1,58 @@
+import asyncio
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+from ._prediction import EchoPrediction
+
+
+class PredictionDeadline:
+    def __init__(self, deadline, fallback=None):
+        self.deadline = deadline  # ms
+        self.fallback = fallback if fallback is not None else EchoPrediction()
+        self.misses = collections.Counter()
+        self.calls = collections.Counter()
+        self.missed = False
+
+        # a single worker keeps predict calls of a module from overlapping
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="predict")
+        self.pending = None
+
+    async def predict(self, predict, module_name, motion_data):
+        return await self.call(predict, module_name, motion_data, lambda: self.fall_back(module_name, motion_data))
+
+    async def predict_batch(self, predict_batch, module_name, motion_data_list):
+        # the batch shares one deadline, when it is missed every frame in it falls back
+        return await self.call(predict_batch, module_name, motion_data_list, lambda: [
+            self.fall_back(module_name, motion_data) for motion_data in motion_data_list
+        ], len(motion_data_list))
+
+    async def call(self, predict, module_name, argument, fall_back, frames=1):
+        self.calls[module_name] += frames
+
+        if self.pending is not None and not self.pending.done():
+            # a late call still holds the worker, the module skips these frames instead of queueing them
+            return fall_back()
+
+        self.pending = asyncio.get_event_loop().run_in_executor(self.executor, predict, argument)
+        self.missed = False
+        try:
+            return await asyncio.wait_for(asyncio.shield(self.pending), self.deadline / 1000)
+        except asyncio.TimeoutError:
+            # the late result is dropped
+            self.pending.add_done_callback(lambda late: late.cancelled() or late.exception())
+            return fall_back()
+
+    def fall_back(self, module_name, motion_data):
+        self.misses[module_name] += 1
+        self.missed = True
+
+        return self.fallback.predict(motion_data)
+
+    def report(self):
+        for module_name, calls in self.calls.items():
+            print("{}: {} deadline misses in {} predictions ({:.3f}%)".format(
+                module_name, self.misses[module_name], calls, 100 * self.misses[module_name] / calls
+            ), flush=True)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
@@ -1,41 +1,105 @@
 import zmq
+from array import array
+
 from ._types import ExternalInputData
+from ._traffic_log import CHANNEL_EXTERNAL_INPUT
+
+INPUT_COUNT = 1 << 16
+
+# bits of an entry in the state table
+STATE_ACTUAL_PRESS = 0b001
+STATE_PREDICTED_PRESS = 0b010
+STATE_KNOWN = 0b100
 
 class ExternalInput:
     def __init__(self, owner):
         self.owner = owner
-        self.states = {}
 
-    def configure(self, context, poller, port):
+        # indexed by (device << 8) | button
+        self.states = bytearray(INPUT_COUNT)
+        self.timestamps = array('q', bytes(8 * INPUT_COUNT))
+
+        # device -> [actual mask, predicted mask], bit n is button n
+        self.device_masks = {}
+        self.changes = set()
+
+    def configure(self, context, poller, endpoint):
         self.socket = context.socket(zmq.PULL)
-        self.socket.bind("tcp://*:" + str(port))
+        self.socket.bind(endpoint)
 
         poller.register(self.socket, zmq.POLLIN)
 
     async def process_events(self, events):
         if self.socket not in dict(events):
             return
-        
-        frame = await self.socket.recv(0, False)
-        input_data = ExternalInputData.from_bytes(frame.bytes)
 
-        self.set_input(input_data)
-            
+        # drain the whole burst so that it costs a single poll round-trip
+        frames = [await self.socket.recv(0, False)]
+        while True:
+            try:
+                frames.append(await self.socket.recv(zmq.NOBLOCK, False))
+            except zmq.Again:
+                break
+
+        changes = []
+        for frame in frames:
+            self.owner.record_traffic(CHANNEL_EXTERNAL_INPUT, frame.bytes)
+
+            input_data = ExternalInputData.from_bytes(frame.bytes)
+            if self.update(input_data):
+                changes.append(input_data)
+
+        # repeated states are dropped, presses released within the burst are kept as edges
+        if len(changes) > 0:
+            self.owner.external_inputs_received(changes)
+
     def get_input(self, input_id):
-        if not input_id in self.states:
+        state = self.states[input_id]
+        if state == 0:
             return None
 
-        return self.states[input_id]
+        return ExternalInputData(
+            self.timestamps[input_id],
+            input_id,
+            (state & STATE_ACTUAL_PRESS) != 0,
+            (state & STATE_PREDICTED_PRESS) != 0
+        )
 
     def set_input(self, input_data):
-        if input_data.id not in self.states and \
-            (not input_data.actual_press and not input_data.predicted_press):
-            return
-        
-        if input_data.id in self.states and \
-            self.states[input_data.id].StateEquals(input_data):
-            return
+        if self.update(input_data):
+            self.owner.external_input_received(input_data)
+
+    def update(self, input_data):
+        state = STATE_KNOWN | \
+            (STATE_ACTUAL_PRESS if input_data.actual_press else 0) | \
+            (STATE_PREDICTED_PRESS if input_data.predicted_press else 0)
+        previous = self.states[input_data.id]
+
+        # unknown inputs are only tracked once they are pressed
+        if previous == 0 and state == STATE_KNOWN:
+            return False
+
+        if previous == state:
+            return False
+
+        self.states[input_data.id] = state
+        self.timestamps[input_data.id] = input_data.timestamp
+        self.update_device_mask(input_data)
+        self.changes.add(input_data.id)
+
+        return True
+
+    def update_device_mask(self, input_data):
+        device, bit = input_data.id >> 8, 1 << (input_data.id & 0xff)
+        masks = self.device_masks.setdefault(device, [0, 0])
+
+        masks[0] = masks[0] | bit if input_data.actual_press else masks[0] & ~bit
+        masks[1] = masks[1] | bit if input_data.predicted_press else masks[1] & ~bit
 
-        self.states[input_data.id] = input_data
+        if masks == [0, 0]:
+            del self.device_masks[device]
 
-        self.owner.external_input_received(input_data)
+    def take_changes(self):
+        # ids of the inputs that changed since the previous call
+        changes, self.changes = self.changes, set()
+        return changes
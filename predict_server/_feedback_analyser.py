@@ -1,15 +1,19 @@
 import zmq
 import time
-import cbor2
+
+from . import utils
+from ._traffic_log import CHANNEL_FEEDBACK
+from ._clock_sync import ClockSync
 
 class FeedbackAnalyser:
     def __init__(self, owner):
         self.owner = owner
         self.feedbacks = {}
+        self.clock_sync = ClockSync()
 
-    def configure(self, context, poller, port):
+    def configure(self, context, poller, endpoint):
         self.socket = context.socket(zmq.PULL)
-        self.socket.bind("tcp://*:" + str(port))
+        self.socket.bind(endpoint)
         
         poller.register(self.socket, zmq.POLLIN)
 
@@ -17,7 +21,11 @@ class FeedbackAnalyser:
         if self.socket not in dict(events):
             return
 
+        import cbor2
+
         data = await self.socket.recv()
+        self.owner.record_traffic(CHANNEL_FEEDBACK, data)
+
         self.process_feedback(cbor2.loads(data))
 
     def start_prediction(self, session):
@@ -60,7 +68,15 @@ class FeedbackAnalyser:
         self.feedbacks[session] = {**entry, **feedback}
 
         if entry['srcmask'] == 0b11:
-            self.owner.feedback_received(self.feedbacks[session])
+            merged = self.feedbacks[session]
+
+            self.clock_sync.annotate(merged)
+            if 'clockOffset' in merged:
+                latency = utils.calc_latency_breakdown(merged)
+                merged['uplinkLatency'] = latency[1]
+                merged['downlinkLatency'] = latency[6]
+
+            self.owner.feedback_received(merged)
                 
             self.feedbacks = {
                 s: self.feedbacks[s] for s in self.feedbacks if s > session
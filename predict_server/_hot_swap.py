@@ -0,0 +1,121 @@
+import time
+import asyncio
+import importlib.util
+import collections
+
+
+def load_module(spec):
+    # "package.module:ClassName", executed from source into a fresh module object every time so
+    # that edited code is picked up and a failing load leaves the running module's globals alone
+    module_name, _, class_name = spec.partition(':')
+
+    found = importlib.util.find_spec(module_name)
+    if found is None or found.origin is None:
+        raise ImportError("no source found for " + module_name)
+
+    module_spec = importlib.util.spec_from_file_location(module_name, found.origin)
+    module = importlib.util.module_from_spec(module_spec)
+    module_spec.loader.exec_module(module)
+
+    return getattr(module, class_name)()
+
+
+class ModuleHotSwap:
+    def __init__(self, owner, latency_budget=None, history_length=256, probation_frames=360):
+        self.owner = owner
+        self.latency_budget = latency_budget  # ms
+        self.history = collections.deque(maxlen=history_length)
+        self.probation_frames = probation_frames
+        self.probation_left = 0
+        self.previous_module = None
+        self.loading = None
+        self.loop = None
+
+    def request(self, spec):
+        if self.loading is not None and not self.loading.done():
+            print("hot swap to {} ignored: another swap is in progress".format(spec), flush=True)
+            return
+
+        self.loading = asyncio.ensure_future(self.swap(spec))
+
+    async def swap(self, spec):
+        try:
+            module, latency = await asyncio.get_event_loop().run_in_executor(
+                None, self.load_and_warm, spec, list(self.history)
+            )
+        except Exception as e:
+            print("hot swap to {} failed: {!r}".format(spec, e), flush=True)
+            return
+
+        if self.exceeds_budget(latency):
+            print("hot swap to {} rejected: warm-up latency {:.2f} ms".format(spec, latency), flush=True)
+            return
+
+        # runs on the event loop, so the switch always falls between two frames
+        self.loop = asyncio.get_event_loop()
+        self.previous_module = self.owner.module
+        self.owner.module = module
+        self.probation_left = self.probation_frames
+
+        print("swapped in {} (warm-up latency {:.2f} ms)".format(spec, latency), flush=True)
+
+    def load_and_warm(self, spec, history):
+        module = load_module(spec)
+
+        latency = 0
+        for motion_data in history:
+            start = time.perf_counter()
+            module.predict(motion_data)
+            latency = max(latency, (time.perf_counter() - start) * 1000)
+
+        return module, latency
+
+    def exceeds_budget(self, latency):
+        return self.latency_budget is not None and latency > self.latency_budget
+
+    def predict(self, motion_data):
+        self.history.append(motion_data)
+
+        return self.call(lambda module: module.predict(motion_data))
+
+    def predict_batch(self, motion_data_list):
+        self.history.extend(motion_data_list)
+
+        return self.call(lambda module: module.predict_batch(motion_data_list))
+
+    def call(self, predict):
+        if self.probation_left == 0:
+            return predict(self.owner.module)
+
+        self.probation_left -= 1
+
+        start = time.perf_counter()
+        try:
+            result = predict(self.owner.module)
+        except Exception as e:
+            return predict(self.rollback("raised {!r}".format(e)))
+
+        latency = (time.perf_counter() - start) * 1000
+        if self.exceeds_budget(latency):
+            # this frame's result is already late, later ones come from the previous module
+            self.rollback("took {:.2f} ms".format(latency))
+        elif self.probation_left == 0:
+            self.previous_module = None
+
+        return result
+
+    def rollback(self, reason):
+        # may run on the prediction deadline's worker thread, the module is only switched on the loop
+        print("rolling back hot swapped module: predict {}".format(reason), flush=True)
+
+        failed, previous = self.owner.module, self.previous_module
+        self.previous_module = None
+        self.probation_left = 0
+
+        self.loop.call_soon_threadsafe(self.restore, failed, previous)
+        return previous
+
+    def restore(self, failed, previous):
+        # unless another swap got in first
+        if self.owner.module is failed:
+            self.owner.module = previous
@@ -0,0 +1,106 @@
+import os
+import time
+import collections
+import zmq
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class LowLatencyMode:
+    # linux only: pins the server to cpus, optionally raises its priority and spins on
+    # the motion socket for spin_time ms before blocking in the poller, or on the shared
+    # memory ring, which never blocks
+    def __init__(self, cpus=None, priority=None, spin_time=0.5, block_timeout=10, history_length=100000):
+        self.cpus = cpus
+        self.priority = priority
+        self.spin_time = spin_time          # ms
+        self.block_timeout = block_timeout  # ms
+
+        self.spin_gaps = collections.deque(maxlen=history_length)
+        self.wakeup_latencies = collections.deque(maxlen=history_length)
+        self.spin_hits = 0
+        self.block_hits = 0
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+
+    def apply(self):
+        if self.cpus is not None:
+            if hasattr(os, 'sched_setaffinity'):
+                try:
+                    os.sched_setaffinity(0, self.cpus)
+                    print("pinned to cpus {}".format(sorted(os.sched_getaffinity(0))), flush=True)
+                except OSError as e:
+                    print("could not pin to cpus {}: {!r}".format(self.cpus, e), flush=True)
+            else:
+                print("cpu pinning is not supported on this platform", flush=True)
+
+        if self.priority is not None:
+            # positive values ask for SCHED_FIFO at that priority, negative ones for a lower nice value
+            try:
+                if self.priority > 0:
+                    os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(self.priority))
+                else:
+                    os.nice(self.priority)
+            except (AttributeError, OSError) as e:
+                print("could not raise scheduling priority: {!r}".format(e), flush=True)
+
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+
+    def spin(self, ready):
+        deadline = time.perf_counter() + self.spin_time / 1000
+        previous = time.perf_counter()
+
+        while True:
+            now = time.perf_counter()
+            if ready():
+                # a frame found while spinning waited at most one spin iteration
+                self.spin_gaps.append(now - previous)
+                self.spin_hits += 1
+                return True
+
+            if now >= deadline:
+                return False
+            previous = now
+
+    async def poll(self, poller, socket, ring=None):
+        if ring is not None:
+            # nothing wakes the poller for the ring, blocking in it would only add latency
+            self.spin(ring.pending)
+            return await poller.poll(0)
+
+        if socket is not None and self.spin(lambda: socket.getsockopt(zmq.EVENTS) & zmq.POLLIN):
+            return await poller.poll(0)
+
+        start = time.perf_counter()
+        events = await poller.poll(self.block_timeout)
+        if len(events) > 0:
+            self.block_hits += 1
+        else:
+            # how late a blocking wait wakes up, as a frame arriving during it would
+            self.wakeup_latencies.append(time.perf_counter() - start - self.block_timeout / 1000)
+
+        return events
+
+    def report(self):
+        for name, samples in (("spin detection", self.spin_gaps), ("blocking wakeup", self.wakeup_latencies)):
+            if len(samples) == 0:
+                continue
+
+            values = sorted(samples)
+            print("{}: p50 {:.1f} us, p99 {:.1f} us, p99.9 {:.1f} us, max {:.1f} us ({} samples)".format(
+                name,
+                percentile(values, 0.5) * 1e6,
+                percentile(values, 0.99) * 1e6,
+                percentile(values, 0.999) * 1e6,
+                values[-1] * 1e6,
+                len(values)
+            ), flush=True)
+
+        wall = time.perf_counter() - self.start_wall
+        print("wakeups caught spinning: {} of {}, cpu usage {:.1f}%".format(
+            self.spin_hits, self.spin_hits + self.block_hits,
+            100 * (time.process_time() - self.start_cpu) / wall if wall > 0 else 0
+        ), flush=True)
@@ -0,0 +1,172 @@
+import gc
+import os
+import sys
+import json
+import time
+import asyncio
+import tracemalloc
+
+
+def read_rss():
+    # bytes, None where neither /proc nor the resource module is available
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    # only the peak is available here
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class MemoryMonitor:
+    # reports rss and the size of the owner's tables every interval seconds, in deep mode
+    # also the allocation sites that grew the most since the previous report
+    def __init__(self, owner, interval=10.0, output="memory", top=10):
+        self.owner = owner
+        self.interval = interval  # s
+        self.output = output
+        self.top = top
+
+        self.task = None
+        self.file = None
+        self.deep = False
+        self.previous_snapshot = None
+        self.first_rss = None
+
+    def control(self, argument):
+        # "on [interval s]", "off", "deep [frames]", "deep-stop" or "dump"
+        command, _, value = argument.partition(' ')
+
+        if command == 'on':
+            self.enable(float(value) if value else None)
+        elif command == 'off':
+            self.disable()
+        elif command == 'deep':
+            self.start_deep(int(value) if value else 1)
+        elif command == 'deep-stop':
+            self.stop_deep()
+        elif command == 'dump':
+            self.report()
+        else:
+            print("unknown memory command: " + argument, flush=True)
+
+    def enable(self, interval=None):
+        if interval is not None:
+            self.interval = interval
+
+        if self.task is not None:
+            return
+
+        # must be called from the thread running the event loop
+        self.task = asyncio.ensure_future(self.run())
+
+        print("memory monitoring on (every {:.1f} s)".format(self.interval), flush=True)
+
+    def disable(self):
+        if self.task is None:
+            return
+
+        self.task.cancel()
+        self.task = None
+
+        print("memory monitoring off", flush=True)
+
+    def start_deep(self, frames=1):
+        if self.deep:
+            return
+
+        # tracing slows every allocation down, so it only runs when asked for
+        tracemalloc.start(frames)
+        self.previous_snapshot = self.take_snapshot()
+        self.deep = True
+
+    def stop_deep(self):
+        if not self.deep:
+            return
+
+        tracemalloc.stop()
+        self.previous_snapshot = None
+        self.deep = False
+
+    def take_snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            tracemalloc.Filter(False, "<unknown>")
+        ])
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.report()
+
+    def report(self):
+        rss = read_rss()
+        if self.first_rss is None:
+            self.first_rss = rss
+
+        record = {
+            'time': time.time(),
+            'rss': rss,
+            'gc': list(gc.get_count()),
+            'tables': self.owner.memory_tables()
+        }
+
+        if self.deep:
+            snapshot = self.take_snapshot()
+            record['traced'], record['traced_peak'] = tracemalloc.get_traced_memory()
+            record['top'] = [
+                {
+                    'site': " <- ".join(str(frame) for frame in reversed(stat.traceback)),
+                    'size': stat.size,
+                    'size_diff': stat.size_diff,
+                    'count_diff': stat.count_diff
+                }
+                for stat in snapshot.compare_to(self.previous_snapshot, 'traceback')[:self.top]
+            ]
+            self.previous_snapshot = snapshot
+
+        self.print_record(record)
+        self.write_record(record)
+        self.owner.memory_reported(record)
+
+    def print_record(self, record):
+        if record['rss'] is not None:
+            print("rss {:.1f} MB ({:+.1f} MB), {}".format(
+                record['rss'] / 1048576,
+                (record['rss'] - self.first_rss) / 1048576,
+                ", ".join("{} {}".format(name, size) for name, size in record['tables'].items())
+            ), flush=True)
+        else:
+            print(", ".join("{} {}".format(name, size) for name, size in record['tables'].items()), flush=True)
+
+        for stat in record.get('top', []):
+            if stat['size_diff'] != 0:
+                print("  {:+.1f} KB ({:+d} blocks) at {}".format(
+                    stat['size_diff'] / 1024, stat['count_diff'], stat['site']
+                ), flush=True)
+
+    def write_record(self, record):
+        if self.file is None:
+            self.file = open(self.output + "-memory.jsonl", 'a')
+
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+
+    def close(self):
+        # the task was cancelled along with the rest of the event loop
+        self.task = None
+        self.stop_deep()
+
+        if self.file is not None:
+            self.file.close()
+            self.file = None
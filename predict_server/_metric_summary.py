@@ -0,0 +1,230 @@
+import math
+import time
+
+from . import utils
+from ._writer import CsvWriter
+
+SUMMARY_ITEMS = utils.LATENCY_ITEMS + ['optimal_overhead', 'actual_overhead']
+SUMMARY_STATISTICS = ('mean', 'p50', 'p95', 'p99')
+
+
+class DDSketch:
+    # quantiles within relative_accuracy of the true value in at most max_bins buckets per sign,
+    # two sketches with the same accuracy merge exactly
+    def __init__(self, relative_accuracy=0.01, max_bins=2048, min_value=1e-9):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.max_bins = max_bins
+        self.min_value = min_value
+
+        self.positive = {}
+        self.negative = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def bin_index(self, value):
+        return math.ceil(math.log(value) / self.log_gamma)
+
+    def bin_value(self, index):
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def add(self, value):
+        if value > self.min_value:
+            bins = self.positive
+            index = self.bin_index(value)
+        elif value < -self.min_value:
+            bins = self.negative
+            index = self.bin_index(-value)
+        else:
+            bins = None
+            self.zero_count += 1
+
+        if bins is not None:
+            bins[index] = bins.get(index, 0) + 1
+            if len(bins) > self.max_bins:
+                self.collapse(bins)
+
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def collapse(self, bins):
+        # the values closest to zero lose accuracy first
+        indices = sorted(bins)
+        excess = len(indices) - self.max_bins
+        for index in indices[:excess]:
+            bins[indices[excess]] += bins.pop(index)
+
+    def merge(self, other):
+        assert(other.gamma == self.gamma)
+
+        for bins, other_bins in ((self.positive, other.positive), (self.negative, other.negative)):
+            for index, count in other_bins.items():
+                bins[index] = bins.get(index, 0) + count
+            if len(bins) > self.max_bins:
+                self.collapse(bins)
+
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def mean(self):
+        return self.sum / self.count if self.count > 0 else None
+
+    def quantile(self, fraction):
+        if self.count == 0:
+            return None
+
+        rank = fraction * (self.count - 1)
+        seen = 0
+
+        for index in sorted(self.negative, reverse=True):
+            seen += self.negative[index]
+            if seen > rank:
+                return max(self.min, -self.bin_value(index))
+
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+
+        for index in sorted(self.positive):
+            seen += self.positive[index]
+            if seen > rank:
+                return min(self.max, self.bin_value(index))
+
+        return self.max
+
+
+class MetricAggregate:
+    def __init__(self, relative_accuracy):
+        self.sketches = {item: DDSketch(relative_accuracy) for item in SUMMARY_ITEMS}
+        self.frames = 0
+        self.frame_size = 0
+        self.first_frame = self.last_frame = None
+        self.start = self.end = None
+
+    def add(self, values, frame, frame_size, now):
+        for item, value in zip(SUMMARY_ITEMS, values):
+            self.sketches[item].add(value)
+
+        self.frames += 1
+        self.frame_size += frame_size
+        self.first_frame = frame if self.first_frame is None else self.first_frame
+        self.last_frame = frame
+        self.start = now if self.start is None else self.start
+        self.end = now
+
+    def merge(self, other):
+        for item in SUMMARY_ITEMS:
+            self.sketches[item].merge(other.sketches[item])
+
+        self.frames += other.frames
+        self.frame_size += other.frame_size
+        self.first_frame = other.first_frame if self.first_frame is None else self.first_frame
+        self.last_frame = other.last_frame
+        self.start = other.start if self.start is None else self.start
+        self.end = other.end
+
+    def make_statistics(self):
+        statistics = []
+        for item in SUMMARY_ITEMS:
+            sketch = self.sketches[item]
+            statistics.extend([
+                sketch.mean(), sketch.quantile(0.5), sketch.quantile(0.95), sketch.quantile(0.99)
+            ])
+
+        return ['' if value is None else str(value) for value in statistics]
+
+
+class MetricSummaryWriter(CsvWriter):
+    # per interval and per session aggregates of the PerfMetricWriter latency and overhead
+    # columns in constant memory, a session being a run of feedback that ends when the client
+    # goes quiet for session_timeout seconds or restarts its frame ids
+    def __init__(self, output, interval=1.0, session_timeout=10.0, relative_accuracy=0.01, rotation=None):
+        super().__init__(output, rotation=rotation)
+
+        self.interval = interval                # s
+        self.session_timeout = session_timeout  # s
+        self.relative_accuracy = relative_accuracy
+
+        self.session_index = 0
+        self.current = None  # since the last interval row
+        self.session = None  # the earlier intervals of this session
+        self.last_frame = None
+        self.interval_start = self.last_seen = time.monotonic()
+
+    def make_header_items(self):
+        return ['kind', 'session', 'first_frame', 'last_frame', 'start', 'end', 'frames', 'frame_size'] + [
+            item + '_' + statistic for item in SUMMARY_ITEMS for statistic in SUMMARY_STATISTICS
+        ]
+
+    def write_metric(self, feedback):
+        now = time.monotonic()
+        frame = feedback['session']
+
+        if self.last_frame is not None and (now - self.last_seen >= self.session_timeout or frame < self.last_frame):
+            self.end_session()
+
+        if self.current is None:
+            self.current = MetricAggregate(self.relative_accuracy)
+
+        self.current.add(
+            utils.calc_latency_breakdown(feedback) + list(utils.calc_overheads(feedback)),
+            frame,
+            round(feedback['frameSize']),
+            time.time()
+        )
+        self.last_frame = frame
+        self.last_seen = now
+
+        if now - self.interval_start >= self.interval:
+            self.flush_interval()
+
+    def check(self):
+        # also called periodically, so that intervals and sessions end while no feedback arrives
+        now = time.monotonic()
+
+        if self.last_frame is not None and now - self.last_seen >= self.session_timeout:
+            self.end_session()
+        elif now - self.interval_start >= self.interval:
+            self.flush_interval()
+
+    def flush_interval(self):
+        self.interval_start = time.monotonic()
+        if self.current is None:
+            return
+
+        self.write_aggregate('interval', self.current)
+
+        if self.session is None:
+            self.session = self.current
+        else:
+            self.session.merge(self.current)
+        self.current = None
+
+    def end_session(self):
+        self.flush_interval()
+
+        if self.session is not None:
+            self.write_aggregate('session', self.session)
+
+        self.session = None
+        self.session_index += 1
+        self.last_frame = None
+
+    def write_aggregate(self, kind, aggregate):
+        self.write_line([
+            kind, str(self.session_index), str(aggregate.first_frame), str(aggregate.last_frame),
+            str(aggregate.start), str(aggregate.end), str(aggregate.frames), str(aggregate.frame_size)
+        ] + aggregate.make_statistics())
+
+    def close(self):
+        self.end_session()
+        super().close()
@@ -1,32 +1,126 @@
 import zmq
+import time
 
 from ._types import MotionData, PredictedData, ExternalInputData
+from ._transport import SharedMemoryRing
+from ._traffic_log import CHANNEL_MOTION
 
 class MotionDataTransport:
     def __init__(self, owner):
         self.owner = owner
         self.accept_client_buttons = False
+        self.socket_recv = self.socket_send = None
+        self.ring_recv = self.ring_send = None
+        self.batch_size = 1
+        self.batch_window = 1.0  # ms
+        self.extended_inputs = False
 
-    def configure(self, context, poller, port_recv, port_send, accept_client_buttons):
+    def configure(self, context, poller, endpoint_recv, endpoint_send, accept_client_buttons):
         self.socket_recv = context.socket(zmq.PULL)
-        self.socket_recv.bind("tcp://*:" + str(port_recv))
+        self.socket_recv.bind(endpoint_recv)
 
         self.socket_send = context.socket(zmq.PUSH)
-        self.socket_send.bind("tcp://*:" + str(port_send))
+        self.socket_send.bind(endpoint_send)
 
         poller.register(self.socket_recv, zmq.POLLIN)
 
         self.accept_client_buttons = accept_client_buttons
 
+    def configure_shared_memory(self, name, accept_client_buttons, extended_inputs=False):
+        self.ring_recv = SharedMemoryRing(name + "-motion", create=True)
+
+        if extended_inputs:
+            # the device masks outgrow the default slots well before the device ids run out
+            self.ring_send = SharedMemoryRing(
+                name + "-predicted", create=True, slot_size=PredictedData.MAX_PACKED_SIZE_WITH_INPUTS
+            )
+        else:
+            self.ring_send = SharedMemoryRing(name + "-predicted", create=True)
+
+        self.accept_client_buttons = accept_client_buttons
+
+    def configure_batching(self, batch_size, batch_window):
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+
+    def close(self):
+        if self.ring_recv is not None:
+            self.ring_recv.close()
+            self.ring_send.close()
+
     async def process_events(self, events, external_input):
+        if self.ring_recv is not None:
+            frames = []
+            frame = self.ring_recv.read()
+            while frame is not None:
+                frames.append(frame)
+                if len(frames) == self.batch_size:
+                    await self.process_frames(frames, external_input)
+                    frames = []
+                frame = self.ring_recv.read()
+
+            if len(frames) > 0:
+                await self.process_frames(frames, external_input)
+            return
+
         if self.socket_recv not in dict(events):
             return
 
         frame = await self.socket_recv.recv(0, False)
-        motion_data = MotionData.from_bytes(frame.bytes)
+        if self.batch_size == 1:
+            await self.process_frame(frame.bytes, external_input)
+            return
+
+        # gather whatever else arrives within the batching window
+        frames = [frame.bytes]
+        deadline = time.perf_counter() + self.batch_window / 1000
+        while len(frames) < self.batch_size:
+            timeout = max(0, round((deadline - time.perf_counter()) * 1000))
+            if not await self.socket_recv.poll(timeout, zmq.POLLIN):
+                break
+
+            frame = await self.socket_recv.recv(0, False)
+            frames.append(frame.bytes)
+
+        await self.process_frames(frames, external_input)
+
+    async def process_frames(self, frames, external_input):
+        if len(frames) == 1:
+            await self.process_frame(frames[0], external_input)
+            return
+
+        motion_data_list = []
+        for frame in frames:
+            self.owner.record_traffic(CHANNEL_MOTION, frame)
+            motion_data_list.append(MotionData.from_bytes(frame))
+
+        motion_data_list[0].external_input_changes = external_input.take_changes()
+
+        for motion_data in motion_data_list:
+            self.owner.pre_predict_motion(motion_data.timestamp)
+
+        results = await self.owner.predict_motion_batch(motion_data_list)
+
+        for motion_data, result in zip(motion_data_list, results):
+            self.send_prediction(motion_data, result, external_input)
+
+    def send(self, data):
+        if self.ring_send is not None:
+            self.ring_send.write(data)
+        else:
+            self.socket_send.send(data)
+
+    async def process_frame(self, frame, external_input):
+        self.owner.record_traffic(CHANNEL_MOTION, frame)
+        motion_data = MotionData.from_bytes(frame)
+        motion_data.external_input_changes = external_input.take_changes()
 
         self.owner.pre_predict_motion(motion_data.timestamp)
 
+        result = await self.owner.predict_motion(motion_data)
+        self.send_prediction(motion_data, result, external_input)
+
+    def send_prediction(self, motion_data, result, external_input):
         prediction_time, \
             predicted_left_eye_position, \
             predicted_right_eye_position, \
@@ -36,8 +130,7 @@ class MotionDataTransport:
             predicted_foveation_inner_radius, \
             predicted_foveation_middle_radius, \
             predicted_right_hand_position, \
-            predicted_right_hand_orientation = \
-            self.owner.predict_motion(motion_data)
+            predicted_right_hand_orientation = result
 
         if self.accept_client_buttons:
             external_input.set_input(ExternalInputData(
@@ -47,7 +140,7 @@ class MotionDataTransport:
                 motion_data.right_hand_primary_button_press
             ))
 
-        # TODO: add all inputs to predicted data
+        # the single input fields stay for clients that do not read the extended variant
         input_data = external_input.get_input(0)
 
         predicted_data = PredictedData(motion_data.timestamp,
@@ -73,6 +166,9 @@ class MotionDataTransport:
 
         self.owner.post_predict_motion(motion_data.timestamp)
 
-        self.socket_send.send(predicted_data.pack())
+        if self.extended_inputs:
+            self.send(predicted_data.pack_with_inputs(external_input.device_masks))
+        else:
+            self.send(predicted_data.pack())
 
-        self.owner.write_prediction_output(motion_data, predicted_data)
+        self.owner.prediction_sent(motion_data, predicted_data)
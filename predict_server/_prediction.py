@@ -1,10 +1,14 @@
+import copy
 import math
 
+from . import utils
+
 class BufferedNoPrediction:
     def __init__(self, bufferCount, prediction_time):
         self.buffer = []
         self.bufferLen = bufferCount
         self.prediction_time = prediction_time
+        self.projection = utils.OverfilledProjection([0.1745, 0.1745, 0.1745, 0.1745])
 
     def put_motion_data(self, motion_data):
         self.buffer.append(motion_data)
@@ -15,7 +19,7 @@ class BufferedNoPrediction:
     def get_predicted_result(self):
         motion_data = self.buffer[0]
 
-        camera_projection = self.overfill_camera_projection(motion_data.camera_projection, [0.1745, 0.1745, 0.1745, 0.1745])
+        camera_projection, _ = self.projection.make(motion_data.camera_projection)
         foveation_inner_radius = 0.25
         foveation_middle_radius = 0.5
 
@@ -29,10 +33,214 @@ class BufferedNoPrediction:
                motion_data.right_hand_position, \
                motion_data.right_hand_orientation
 
-    def overfill_camera_projection(self, camera_projection, overfilling):
-        return [
-            math.tan(math.atan(camera_projection[0]) - overfilling[0]),
-            math.tan(math.atan(camera_projection[1]) + overfilling[1]),
-            math.tan(math.atan(camera_projection[2]) + overfilling[2]),
-            math.tan(math.atan(camera_projection[3]) - overfilling[3])
-        ]
+
+class EchoPrediction:
+    def __init__(self, prediction_time=0.0, overfilling=(0.1745, 0.1745, 0.1745, 0.1745),
+                 foveation_inner_radius=1.06, foveation_middle_radius=1.42):
+        self.prediction_time = prediction_time
+        self.overfilling = overfilling
+        self.projection = utils.OverfilledProjection(overfilling)
+        self.foveation_inner_radius = foveation_inner_radius
+        self.foveation_middle_radius = foveation_middle_radius
+
+    def predict(self, motion_data):
+        left_camera_projection, right_camera_projection = self.projection.make(motion_data.camera_projection)
+
+        return self.prediction_time, \
+               motion_data.left_eye_position, \
+               motion_data.right_eye_position, \
+               motion_data.head_orientation, \
+               left_camera_projection, \
+               right_camera_projection, \
+               self.foveation_inner_radius, \
+               self.foveation_middle_radius, \
+               motion_data.right_hand_position, \
+               motion_data.right_hand_orientation
+
+
+class OneEuroFilter:
+    # one-euro filter over each channel of a fixed size vector, times in seconds
+    def __init__(self, size, min_cutoff=1.0, beta=0.007, derivative_cutoff=1.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.derivative_cutoff = derivative_cutoff
+
+        self.channels = range(size)
+        self.previous = [0.0] * size
+        self.previous_derivative = [0.0] * size
+        self.previous_time = None
+
+    def filter(self, values, time):
+        # values are replaced with their filtered values in place
+        if self.previous_time is None:
+            for i in self.channels:
+                self.previous[i] = values[i]
+            self.previous_time = time
+            return values
+
+        if time <= self.previous_time:
+            # a repeated or out of order frame, keep the last output
+            for i in self.channels:
+                values[i] = self.previous[i]
+            return values
+
+        dt = time - self.previous_time
+        self.previous_time = time
+
+        derivative_alpha = 1 / (1 + 1 / (2 * math.pi * self.derivative_cutoff * dt))
+        for i in self.channels:
+            derivative = derivative_alpha * (values[i] - self.previous[i]) / dt + \
+                (1 - derivative_alpha) * self.previous_derivative[i]
+            cutoff = self.min_cutoff + self.beta * abs(derivative)
+            alpha = 1 / (1 + 1 / (2 * math.pi * cutoff * dt))
+
+            self.previous[i] = values[i] = alpha * values[i] + (1 - alpha) * self.previous[i]
+            self.previous_derivative[i] = derivative
+
+        return values
+
+
+class ConstantVelocityKalmanFilter:
+    # independent position/velocity kalman filter per axis, process noise is the
+    # variance of the acceleration (m^2/s^4), measurement noise that of the position (m^2)
+    def __init__(self, size=3, process_noise=1.0, measurement_noise=1e-6):
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+
+        self.channels = range(size)
+        self.position = [0.0] * size
+        self.velocity = [0.0] * size
+        self.covariance = [[measurement_noise, 0.0, 1.0] for _ in self.channels]  # p00, p01, p11
+        self.previous_time = None
+
+    def filter(self, values, time):
+        if self.previous_time is None:
+            for i in self.channels:
+                self.position[i] = values[i]
+            self.previous_time = time
+            return values
+
+        if time <= self.previous_time:
+            for i in self.channels:
+                values[i] = self.position[i]
+            return values
+
+        dt = time - self.previous_time
+        self.previous_time = time
+
+        q = self.process_noise
+        q00, q01, q11 = q * dt * dt * dt / 3, q * dt * dt / 2, q * dt
+
+        for i in self.channels:
+            p00, p01, p11 = self.covariance[i]
+
+            # predict
+            position = self.position[i] + self.velocity[i] * dt
+            p00 += dt * (2 * p01 + dt * p11) + q00
+            p01 += dt * p11 + q01
+            p11 += q11
+
+            # update
+            s = p00 + self.measurement_noise
+            k0, k1 = p00 / s, p01 / s
+            residual = values[i] - position
+
+            self.position[i] = values[i] = position + k0 * residual
+            self.velocity[i] += k1 * residual
+
+            covariance = self.covariance[i]
+            covariance[0] = (1 - k0) * p00
+            covariance[1] = (1 - k0) * p01
+            covariance[2] = p11 - k1 * p01
+
+        return values
+
+
+class SlerpFilter:
+    # exponential smoothing of an (x, y, z, w) quaternion along the great arc,
+    # time_constant in seconds
+    def __init__(self, time_constant=0.01):
+        self.time_constant = time_constant
+        self.state = [0.0, 0.0, 0.0, 1.0]
+        self.previous_time = None
+
+    def filter(self, quaternion, time):
+        state = self.state
+
+        if self.previous_time is None:
+            state[0], state[1], state[2], state[3] = quaternion[0], quaternion[1], quaternion[2], quaternion[3]
+            self.previous_time = time
+            return quaternion
+
+        if time <= self.previous_time:
+            quaternion[0], quaternion[1], quaternion[2], quaternion[3] = state[0], state[1], state[2], state[3]
+            return quaternion
+
+        amount = 1 - math.exp(-(time - self.previous_time) / self.time_constant)
+        self.previous_time = time
+
+        dot = state[0] * quaternion[0] + state[1] * quaternion[1] + state[2] * quaternion[2] + state[3] * quaternion[3]
+        sign = 1.0
+        if dot < 0:
+            dot, sign = -dot, -1.0
+
+        if dot > 0.9995:
+            # nearly the same orientation, a normalized lerp is precise enough
+            w0, w1 = 1 - amount, amount * sign
+        else:
+            theta = math.acos(dot)
+            sin_theta = math.sin(theta)
+            w0 = math.sin((1 - amount) * theta) / sin_theta
+            w1 = math.sin(amount * theta) / sin_theta * sign
+
+        x = w0 * state[0] + w1 * quaternion[0]
+        y = w0 * state[1] + w1 * quaternion[1]
+        z = w0 * state[2] + w1 * quaternion[2]
+        w = w0 * state[3] + w1 * quaternion[3]
+        norm = math.sqrt(x * x + y * y + z * z + w * w)
+
+        state[0] = quaternion[0] = x / norm
+        state[1] = quaternion[1] = y / norm
+        state[2] = quaternion[2] = z / norm
+        state[3] = quaternion[3] = w / norm
+
+        return quaternion
+
+
+class FilteredPrediction:
+    # runs filters over MotionData channels before handing the frame to module, e.g.
+    # FilteredPrediction(App(), head_orientation=SlerpFilter(), right_hand_position=ConstantVelocityKalmanFilter())
+    def __init__(self, module, timestamp_units_per_ms=1.0, **filters):
+        self.module = module
+        self.timestamp_units_per_ms = timestamp_units_per_ms
+        self.filters = filters
+
+    def filter(self, motion_data):
+        # every frame gets its own filtered channels, predictors may return them as their
+        # result and results are kept around (writers, cache, shadow scoring), while the
+        # raw frame is still what gets recorded as input
+        filtered = copy.copy(motion_data)
+        time = motion_data.timestamp / (self.timestamp_units_per_ms * 1000)
+
+        for name, channel_filter in self.filters.items():
+            setattr(filtered, name, channel_filter.filter(list(getattr(motion_data, name)), time))
+
+        return filtered
+
+    def predict(self, motion_data):
+        return self.module.predict(self.filter(motion_data))
+
+    def predict_batch(self, motion_data_list):
+        return self.module.predict_batch([self.filter(motion_data) for motion_data in motion_data_list])
+
+    def feedback_received(self, feedback):
+        self.module.feedback_received(feedback)
+
+    def external_input_received(self, input_data):
+        self.module.external_input_received(input_data)
+
+    def external_inputs_received(self, input_data_list):
+        self.module.external_inputs_received(input_data_list)
+
+    def game_event_received(self, event):
+        self.module.game_event_received(event)
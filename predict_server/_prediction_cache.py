@@ -0,0 +1,72 @@
+import collections
+
+
+def quantize(values, tolerance):
+    return tuple(round(value / tolerance) for value in values)
+
+
+class PredictionCache:
+    def __init__(self, capacity=64,
+                 position_tolerance=0.0005, orientation_tolerance=0.0001,
+                 projection_tolerance=0.0001, motion_tolerance=None):
+        self.capacity = capacity
+        self.position_tolerance = position_tolerance        # m
+        self.orientation_tolerance = orientation_tolerance  # quaternion component
+        self.projection_tolerance = projection_tolerance    # tangent of half angle
+        self.motion_tolerance = motion_tolerance            # acceleration, angular velocity, None to ignore
+
+        self.entries = collections.OrderedDict()
+        self.module = None
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, motion_data):
+        # frames that fall into the same bucket on every input share one prediction
+        key = (
+            quantize(motion_data.left_eye_position, self.position_tolerance),
+            quantize(motion_data.right_eye_position, self.position_tolerance),
+            quantize(motion_data.head_orientation, self.orientation_tolerance),
+            quantize(motion_data.camera_projection, self.projection_tolerance),
+            quantize(motion_data.right_hand_position, self.position_tolerance),
+            quantize(motion_data.right_hand_orientation, self.orientation_tolerance),
+            motion_data.right_hand_primary_button_press
+        )
+        if self.motion_tolerance is None:
+            # sensor noise on these alone would keep every frame in its own bucket
+            return key
+
+        return key + (
+            quantize(motion_data.head_acceleration, self.motion_tolerance),
+            quantize(motion_data.head_angular_velocity, self.motion_tolerance),
+            quantize(motion_data.right_hand_acceleration, self.motion_tolerance),
+            quantize(motion_data.right_hand_angular_velocity, self.motion_tolerance)
+        )
+
+    def lookup(self, module, key):
+        # results of a hot swapped out module must not be served
+        if module is not self.module:
+            self.entries.clear()
+            self.module = module
+
+        result = self.entries.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def store(self, key, result):
+        self.entries[key] = result
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def report(self):
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return
+
+        print("prediction cache: {} hits, {} misses ({:.3f}% hit rate)".format(
+            self.hits, self.misses, 100 * self.hits / lookups
+        ), flush=True)
@@ -0,0 +1,180 @@
+import gc
+import sys
+import json
+import time
+import asyncio
+import threading
+import traceback
+import collections
+
+
+class SlowFrameProfiler:
+    def __init__(self, threshold=5.0, output="profile", capacity=256):
+        self.threshold = threshold  # ms
+        self.output = output
+        self.records = collections.deque(maxlen=capacity)
+        self.enabled = False
+        self.deep_profile = None
+
+        self.thread_id = None
+        self.watchdog = None
+        self.lag_monitor = None
+
+        self.frame_start = None
+        self.frame_session = None
+        self.sample = None
+        self.reset_frame_state()
+
+    def reset_frame_state(self):
+        self.loop_lag = 0.0
+        self.gc_start = None
+        self.gc_time = 0.0
+        self.gc_collections = 0
+
+    def control(self, argument):
+        # "on [threshold ms]", "off", "deep", "deep-stop" or "dump"
+        command, _, value = argument.partition(' ')
+
+        if command == 'on':
+            self.enable(float(value) if value else None)
+        elif command == 'off':
+            self.disable()
+        elif command == 'deep':
+            self.start_deep()
+        elif command == 'deep-stop':
+            self.stop_deep()
+        elif command == 'dump':
+            self.dump()
+        else:
+            print("unknown profile command: " + argument, flush=True)
+
+    def enable(self, threshold=None):
+        if threshold is not None:
+            self.threshold = threshold
+
+        if self.enabled:
+            return
+
+        # must be called from the thread running the event loop
+        self.enabled = True
+        self.thread_id = threading.get_ident()
+        gc.callbacks.append(self.gc_callback)
+
+        self.watchdog = threading.Thread(target=self.watch, name="profiler", daemon=True)
+        self.watchdog.start()
+        self.lag_monitor = asyncio.ensure_future(self.monitor_lag())
+
+        print("slow frame profiling on (threshold {:.2f} ms)".format(self.threshold), flush=True)
+
+    def disable(self):
+        if not self.enabled:
+            return
+
+        self.enabled = False
+        gc.callbacks.remove(self.gc_callback)
+        self.lag_monitor.cancel()
+        self.lag_monitor = None
+        self.frame_start = None
+
+        # at most one sleep of the watchdog, so that an immediate "on" cannot start a second one
+        self.watchdog.join()
+        self.watchdog = None
+
+        print("slow frame profiling off", flush=True)
+
+    def start_deep(self):
+        if self.deep_profile is not None:
+            return
+
+        import cProfile
+
+        self.deep_profile = cProfile.Profile()
+        self.deep_profile.enable()
+
+    def stop_deep(self):
+        if self.deep_profile is None:
+            return
+
+        self.deep_profile.disable()
+
+        path = "{}-{}.prof".format(self.output, time.strftime("%Y%m%d-%H%M%S"))
+        self.deep_profile.dump_stats(path)
+        self.deep_profile = None
+
+        print("profile written to " + path, flush=True)
+
+    def watch(self):
+        # samples the loop thread while a frame is still running past the threshold
+        while self.enabled:
+            time.sleep(self.threshold / 4000)
+
+            start = self.frame_start
+            if start is None or self.sample is not None:
+                continue
+
+            if (time.perf_counter() - start) * 1000 > self.threshold:
+                frame = sys._current_frames().get(self.thread_id)
+                if frame is not None:
+                    self.sample = (start, traceback.format_stack(frame))
+
+    async def monitor_lag(self, interval=0.005):
+        loop = asyncio.get_event_loop()
+        while True:
+            expected = loop.time() + interval
+            await asyncio.sleep(interval)
+            self.loop_lag = max(self.loop_lag, (loop.time() - expected) * 1000)
+
+    def gc_callback(self, phase, info):
+        if phase == 'start':
+            self.gc_start = time.perf_counter()
+        elif self.gc_start is not None:
+            self.gc_time += (time.perf_counter() - self.gc_start) * 1000
+            self.gc_collections += 1
+            self.gc_start = None
+
+    def frame_started(self, session):
+        if not self.enabled or self.frame_start is not None:
+            return
+
+        self.frame_session = session
+        self.frame_start = time.perf_counter()
+
+    def frame_finished(self):
+        start = self.frame_start
+        if start is None:
+            return
+
+        duration = (time.perf_counter() - start) * 1000
+        if duration > self.threshold:
+            sample = self.sample if self.sample is not None and self.sample[0] == start else None
+
+            self.records.append({
+                'session': self.frame_session,
+                'time': time.time(),
+                'duration': duration,
+                'loop_lag': self.loop_lag,
+                'gc_time': self.gc_time,
+                'gc_collections': self.gc_collections,
+                'gc_counts': gc.get_count(),
+                'stack': sample[1] if sample is not None else None
+            })
+
+        self.frame_start = None
+        self.sample = None
+        self.reset_frame_state()
+
+    def dump(self):
+        if len(self.records) == 0:
+            return
+
+        path = self.output + "-slow-frames.jsonl"
+        with open(path, 'w') as file:
+            for record in self.records:
+                file.write(json.dumps(record) + "\n")
+
+        print("{} slow frames written to {}".format(len(self.records), path), flush=True)
+
+    def close(self):
+        self.stop_deep()
+        self.enabled = False
+        self.dump()
@@ -0,0 +1,114 @@
+import os
+import csv
+import json
+import struct
+
+RECORDING_EXTENSION = '.rec'
+RECORDING_MAGIC = b'PSREC\x01\x00\x00'
+
+# magic, header length, json column list; rows start at the next 64 byte boundary
+HEADER_ALIGNMENT = 64
+
+
+def is_recording(path):
+    return os.path.splitext(path)[1] == RECORDING_EXTENSION
+
+
+def make_recording_dtype(columns):
+    import numpy as np
+
+    # the first column is always the timestamp the index is built on
+    return np.dtype(
+        [(columns[0], '<i8')] + [(column, '<f8') for column in columns[1:]]
+    )
+
+
+class RecordingWriter:
+    def __init__(self, output, columns):
+        self.output = open(output, 'wb')
+        self.row_format = '<q{}d'.format(len(columns) - 1)
+
+        header = json.dumps(columns).encode('utf-8')
+        offset = len(RECORDING_MAGIC) + 4 + len(header)
+        padding = -offset % HEADER_ALIGNMENT
+
+        self.output.write(RECORDING_MAGIC)
+        self.output.write(struct.pack('<I', len(header) + padding))
+        self.output.write(header + b' ' * padding)
+        self.output.flush()
+
+    def write_values(self, values):
+        self.output.write(struct.pack(self.row_format, int(values[0]), *values[1:]))
+
+    def write_rows(self, timestamps, rows):
+        import numpy as np
+
+        # every field is 8 bytes wide, so the timestamp is written through an integer view
+        data = np.empty((len(rows), rows.shape[1] + 1))
+        data[:, 1:] = rows
+        data.view(np.int64)[:, 0] = timestamps
+
+        self.output.write(data.tobytes())
+
+    def flush(self):
+        self.output.flush()
+
+    def close(self):
+        self.output.close()
+
+
+class RecordingReader:
+    def __init__(self, path):
+        import numpy as np
+
+        with open(path, 'rb') as f:
+            if f.read(len(RECORDING_MAGIC)) != RECORDING_MAGIC:
+                raise ValueError("not a recording: " + path)
+
+            header_length = struct.unpack('<I', f.read(4))[0]
+            self.columns = json.loads(f.read(header_length).decode('utf-8'))
+
+        self.dtype = make_recording_dtype(self.columns)
+
+        offset = len(RECORDING_MAGIC) + 4 + header_length
+        count = (os.path.getsize(path) - offset) // self.dtype.itemsize
+
+        # a writer may still be appending, so only map the rows written completely
+        self.records = np.memmap(
+            path, dtype=self.dtype, mode='r', offset=offset, shape=(count,)
+        ) if count > 0 else np.empty(0, dtype=self.dtype)
+
+        self.timestamps = self.records[self.columns[0]]
+
+    def __len__(self):
+        return len(self.records)
+
+    def index_range(self, start=None, stop=None):
+        import numpy as np
+
+        begin = 0 if start is None else int(np.searchsorted(self.timestamps, start, 'left'))
+        end = len(self.records) if stop is None else int(np.searchsorted(self.timestamps, stop, 'left'))
+
+        return begin, max(begin, end)
+
+    def window(self, start=None, stop=None):
+        begin, end = self.index_range(start, stop)
+        return self.records[begin:end]
+
+    def column(self, name, start=None, stop=None):
+        begin, end = self.index_range(start, stop)
+        return self.records[name][begin:end]
+
+
+def convert_csv_recording(input_csv, output):
+    with open(input_csv, newline='') as csvfile:
+        reader = csv.reader(csvfile)
+        writer = RecordingWriter(output, next(reader))
+
+        try:
+            for row in reader:
+                writer.write_values(
+                    [int(float(row[0]))] + [float(value) for value in row[1:]]
+                )
+        finally:
+            writer.close()
@@ -0,0 +1,179 @@
+import os
+import re
+import csv
+import glob
+import time
+import queue
+import threading
+
+COMPRESSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+
+
+def split_compression(path):
+    for compression, suffix in COMPRESSIONS.items():
+        if path.endswith(suffix):
+            return path[:-len(suffix)], compression
+
+    return path, None
+
+
+def open_compressed(path, mode, compression):
+    # text mode for reading, binary for writing
+    if compression is None:
+        return open(path, mode, newline='' if 'b' not in mode else None)
+
+    if compression == 'gzip':
+        import gzip
+
+        return gzip.open(path, mode if 'b' in mode else 'rt', newline=None if 'b' in mode else '')
+
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("zstd compression needs the zstandard package")
+
+    if 'b' in mode:
+        return zstandard.open(path, mode)
+    return zstandard.open(path, 'rt', newline='')
+
+
+class RotatingOutput:
+    # a write-only text file split into segments by size or age, written and compressed
+    # on a worker thread, every segment starts with the header so it can be read alone
+    def __init__(self, path, header="", max_bytes=None, max_seconds=None, compression=None,
+                 retention=None, max_queued=4096):
+        path, suffix_compression = split_compression(path)
+        self.compression = compression if compression is not None else suffix_compression
+        self.base, self.extension = os.path.splitext(path)
+        self.header = header.encode('utf-8')
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.retention = retention
+        self.rotating = max_bytes is not None or max_seconds is not None
+
+        # bounded, a stalled disk eventually holds up the writer instead of growing memory
+        self.queue = queue.Queue(maxsize=max_queued)
+        self.segment_index = 0
+        self.segment = None
+        self.error = None
+        self.dropped = 0
+
+        # the first segment is opened here so that a bad path or compression fails right away
+        self.open_segment()
+
+        self.thread = threading.Thread(target=self.run, name="output-" + os.path.basename(path), daemon=True)
+        self.thread.start()
+
+    def segment_path(self, index):
+        suffix = COMPRESSIONS.get(self.compression, '')
+        if not self.rotating:
+            return self.base + self.extension + suffix
+
+        return "{}.{:04d}{}{}".format(self.base, index, self.extension, suffix)
+
+    def write(self, data):
+        self.queue.put(data)
+
+    def flush(self):
+        # segments are flushed by the worker thread
+        pass
+
+    def queued(self):
+        return self.queue.qsize()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+        if self.error is not None:
+            print("{} lines dropped from {}".format(self.dropped, self.segment_path(self.segment_index)), flush=True)
+            raise self.error
+
+    def run(self):
+        while True:
+            data = self.queue.get()
+            if data is None:
+                break
+
+            # after a failure the queue is still drained, a full one would block the server on write
+            if self.error is not None:
+                self.dropped += 1
+                continue
+
+            try:
+                self.write_segment(data)
+            except Exception as e:
+                print("writing {} failed: {!r}".format(self.segment_path(self.segment_index), e), flush=True)
+                self.error = e
+                self.dropped += 1
+
+        try:
+            self.segment.close()
+        except Exception as e:
+            self.error = self.error or e
+
+    def write_segment(self, data):
+        if self.segment_full():
+            self.open_segment()
+
+        encoded = data.encode('utf-8')
+        self.segment.write(encoded)
+        self.segment_bytes += len(encoded)
+
+        if self.queue.empty():
+            self.segment.flush()
+
+    def segment_full(self):
+        if self.max_bytes is not None and self.segment_bytes >= self.max_bytes:
+            return True
+
+        return self.max_seconds is not None and time.monotonic() - self.segment_start >= self.max_seconds
+
+    def open_segment(self):
+        if self.segment is not None:
+            self.segment.close()
+            self.segment_index += 1
+
+            if self.retention is not None and self.segment_index >= self.retention:
+                expired = self.segment_path(self.segment_index - self.retention)
+                if os.path.exists(expired):
+                    os.remove(expired)
+
+        self.segment = open_compressed(self.segment_path(self.segment_index), 'wb', self.compression)
+        self.segment.write(self.header)
+        self.segment_bytes = len(self.header)
+        self.segment_start = time.monotonic()
+
+
+def segment_paths(path):
+    # the file itself, or the segments a RotatingOutput wrote for it in order
+    if os.path.exists(path):
+        return [path]
+
+    base, _ = split_compression(path)
+    base, extension = os.path.splitext(base)
+
+    # indices are zero padded to four digits but keep growing past 9999
+    pattern = re.compile(re.escape(base) + r"\.(\d+)" + re.escape(extension) + "({})?$".format(
+        "|".join(re.escape(suffix) for suffix in COMPRESSIONS.values())
+    ))
+    segments = []
+    for candidate in glob.glob(glob.escape(base) + ".*" + extension + "*"):
+        match = pattern.match(candidate)
+        if match is not None:
+            segments.append((int(match.group(1)), candidate))
+
+    if len(segments) == 0:
+        raise FileNotFoundError(path)
+
+    return [candidate for _, candidate in sorted(segments)]
+
+
+def open_text(path):
+    return open_compressed(path, 'r', split_compression(path)[1])
+
+
+def read_csv_rows(path):
+    for segment in segment_paths(path):
+        with open_text(segment) as csvfile:
+            yield from csv.DictReader(csvfile)
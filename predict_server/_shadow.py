@@ -0,0 +1,234 @@
+import math
+import time
+import heapq
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+from . import utils
+from ._recording import RecordingWriter, RecordingReader
+
+MOTION_SCORE_COLUMNS = [
+    'timestamp',
+    'prediction_time',
+    'predict_latency',
+    'head_orientation_error',
+    'left_eye_position_error',
+    'right_eye_position_error',
+    'right_hand_position_error'
+]
+
+OVERHEAD_SCORE_COLUMNS = [
+    'timestamp',
+    'optimal_overhead',
+    'actual_overhead'
+]
+
+
+def angle_between(q1, q2):
+    dot = abs(sum(a * b for a, b in zip(q1, q2))) / math.sqrt(
+        sum(a * a for a in q1) * sum(b * b for b in q2)
+    )
+    return 2 * math.acos(min(dot, 1.0))
+
+
+class ShadowRunner:
+    # all state below is only touched from this runner's own worker thread
+    def __init__(self, name, module, output, timestamp_units_per_ms, max_queued, result_history=512):
+        self.name = name
+        self.module = module
+        self.timestamp_units_per_ms = timestamp_units_per_ms
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow-" + name)
+        self.slots = threading.BoundedSemaphore(max_queued)
+        self.dropped = 0
+
+        self.awaiting_motion = []
+        self.awaiting_feedback = collections.OrderedDict()
+        self.result_history = result_history
+
+        self.motion_scores_path = output + "-" + name + "-motion.rec"
+        self.motion_scores = RecordingWriter(self.motion_scores_path, MOTION_SCORE_COLUMNS)
+        self.overhead_scores = RecordingWriter(output + "-" + name + "-overhead.rec", OVERHEAD_SCORE_COLUMNS)
+        self.score_count = 0
+
+    def reserve(self):
+        # a shadow that cannot keep up skips frames instead of queueing without bound
+        return self.slots.acquire(blocking=False)
+
+    def submit(self, job, *args):
+        if not self.reserve():
+            self.dropped += 1
+            return
+
+        self.submit_reserved(job, *args)
+
+    def submit_reserved(self, job, *args):
+        self.executor.submit(self.run_job, job, *args)
+
+    def run_job(self, job, *args):
+        try:
+            job(*args)
+        except Exception as e:
+            print("shadow {} failed: {!r}".format(self.name, e), flush=True)
+        finally:
+            self.slots.release()
+
+    def predict(self, motion_data):
+        start = time.perf_counter()
+        result = self.module.predict(motion_data)
+        latency = (time.perf_counter() - start) * 1000
+
+        self.score_motion(motion_data, result, latency)
+
+    def score_motion(self, motion_data, result, latency):
+        # predictions whose target time has come are scored against this frame
+        while len(self.awaiting_motion) > 0 and self.awaiting_motion[0][0] <= motion_data.timestamp:
+            _, timestamp, (prediction_time, left_eye_position, right_eye_position, head_orientation,
+                           _, _, _, _, right_hand_position, _), predict_latency = heapq.heappop(self.awaiting_motion)
+
+            values = [
+                prediction_time,
+                predict_latency,
+                angle_between(head_orientation, motion_data.head_orientation),
+                math.dist(left_eye_position, motion_data.left_eye_position),
+                math.dist(right_eye_position, motion_data.right_eye_position),
+                math.dist(right_hand_position, motion_data.right_hand_position)
+            ]
+            self.motion_scores.write_values([timestamp] + values)
+            self.score_count += 1
+
+        target = motion_data.timestamp + result[0] * self.timestamp_units_per_ms
+        heapq.heappush(self.awaiting_motion, (target, motion_data.timestamp, result, latency))
+
+        self.awaiting_feedback[motion_data.timestamp] = result
+        while len(self.awaiting_feedback) > self.result_history:
+            self.awaiting_feedback.popitem(last=False)
+
+    def score_feedback(self, feedback):
+        if self.module is not None:
+            self.module.feedback_received(feedback)
+
+        result = self.awaiting_feedback.pop(feedback['session'], None)
+        if result is None:
+            return
+
+        # the feedback orientations are mirrored in x and y, the predicted one is not
+        hmd_orientation = [
+            feedback['hmdOrientationW'],
+            -feedback['hmdOrientationX'],
+            -feedback['hmdOrientationY'],
+            feedback['hmdOrientationZ']
+        ]
+        frame_orientation = [result[3][3], result[3][0], result[3][1], result[3][2]]
+        left_eye_projection = [
+            feedback['hmdProjectionL'],
+            feedback['hmdProjectionT'],
+            feedback['hmdProjectionR'],
+            feedback['hmdProjectionB']
+        ]
+
+        optimal_overhead, actual_overhead = utils.calc_frame_overheads(
+            hmd_orientation, left_eye_projection, frame_orientation, result[4], result[5]
+        )
+
+        self.overhead_scores.write_values([feedback['session'], optimal_overhead, actual_overhead])
+
+    def summary(self, paired_timestamps):
+        # means over the frames every runner scored
+        import numpy as np
+
+        records = RecordingReader(self.motion_scores_path).records
+        paired = records[np.isin(records['timestamp'], paired_timestamps)]
+        if len(paired) == 0:
+            return "{}: no paired predictions ({} scored)".format(self.name, self.score_count)
+
+        return "{}: {} paired of {} scored, {} dropped, mean {}".format(
+            self.name, len(paired), self.score_count, self.dropped, ", ".join(
+                "{} {:.6g}".format(column, float(np.mean(paired[column])))
+                for column in MOTION_SCORE_COLUMNS[2:]
+            )
+        )
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.motion_scores.close()
+        self.overhead_scores.close()
+
+
+class ShadowEvaluator:
+    def __init__(self, modules, output="shadow", timestamp_units_per_ms=1.0, max_queued=8):
+        # the primary is scored the same way from what was actually sent, as the baseline
+        self.primary = ShadowRunner("primary", None, output, timestamp_units_per_ms, max_queued)
+        self.shadows = [
+            ShadowRunner("{}-{}".format(index, type(module).__name__), module, output,
+                         timestamp_units_per_ms, max_queued)
+            for index, module in enumerate(modules, 1)
+        ]
+
+    def reserve_all(self):
+        # a frame goes to every runner or to none, so that they are all scored on the same frames
+        runners = [self.primary] + self.shadows
+        for index, runner in enumerate(runners):
+            if not runner.reserve():
+                for reserved in runners[:index]:
+                    reserved.slots.release()
+                for skipped in runners:
+                    skipped.dropped += 1
+                return False
+
+        return True
+
+    def submit(self, motion_data, predicted_data):
+        if not self.reserve_all():
+            return
+
+        # predict latency is not measured for the primary and recorded as 0
+        self.primary.submit_reserved(self.primary.score_motion, motion_data, (
+            predicted_data.prediction_time,
+            predicted_data.predicted_left_eye_position,
+            predicted_data.predicted_right_eye_position,
+            predicted_data.predicted_head_orientation,
+            predicted_data.predicted_left_camera_projection,
+            predicted_data.predicted_right_camera_projection,
+            predicted_data.predicted_foveation_inner_radius,
+            predicted_data.predicted_foveation_middle_radius,
+            predicted_data.predicted_right_hand_position,
+            predicted_data.predicted_right_hand_orientation
+        ), 0.0)
+
+        for shadow in self.shadows:
+            shadow.submit_reserved(shadow.predict, motion_data)
+
+    def feedback_received(self, feedback):
+        if not self.reserve_all():
+            return
+
+        for runner in [self.primary] + self.shadows:
+            runner.submit_reserved(runner.score_feedback, feedback)
+
+    def external_input_received(self, input_data):
+        for shadow in self.shadows:
+            shadow.submit(shadow.module.external_input_received, input_data)
+
+    def external_inputs_received(self, input_data_list):
+        for shadow in self.shadows:
+            shadow.submit(shadow.module.external_inputs_received, input_data_list)
+
+    def game_event_received(self, event):
+        for shadow in self.shadows:
+            shadow.submit(shadow.module.game_event_received, event)
+
+    def close(self):
+        runners = [self.primary] + self.shadows
+        for runner in runners:
+            runner.close()
+
+        # a job can still fail in one runner, so only frames every runner scored are compared
+        import numpy as np
+
+        paired = RecordingReader(self.primary.motion_scores_path).records['timestamp']
+        for runner in self.shadows:
+            paired = np.intersect1d(paired, RecordingReader(runner.motion_scores_path).records['timestamp'])
+
+        for runner in runners:
+            print(runner.summary(paired), flush=True)
@@ -0,0 +1,50 @@
+import zmq
+import struct
+
+from . import utils
+
+# subscribers filter on the first frame of each message
+TOPIC_FEEDBACK = b'feedback'
+TOPIC_LATENCY = b'latency'
+TOPIC_GAME_EVENT = b'gevt'
+TOPIC_MEMORY = b'memory'
+
+# session followed by utils.LATENCY_ITEMS
+LATENCY_FORMAT = '<q{}d'.format(len(utils.LATENCY_ITEMS))
+
+
+class TelemetryPublisher:
+    def __init__(self, owner):
+        self.owner = owner
+        self.socket = None
+
+    def configure(self, context, endpoint):
+        self.socket = context.socket(zmq.PUB)
+        self.socket.setsockopt(zmq.SNDHWM, 1000)
+        self.socket.bind(endpoint)
+
+    def publish(self, topic, payload):
+        # pub sockets drop instead of blocking when a subscriber falls behind
+        self.socket.send_multipart([topic, payload])
+
+    def publish_feedback(self, feedback):
+        import cbor2
+
+        self.publish(TOPIC_FEEDBACK, cbor2.dumps(feedback))
+        self.publish(TOPIC_LATENCY, struct.pack(
+            LATENCY_FORMAT, feedback['session'], *utils.calc_latency_breakdown(feedback)
+        ))
+
+    def publish_game_event(self, event):
+        import cbor2
+
+        self.publish(TOPIC_GAME_EVENT, cbor2.dumps(event))
+
+    def publish_memory(self, record):
+        import cbor2
+
+        self.publish(TOPIC_MEMORY, cbor2.dumps(record))
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close(linger=0)
@@ -0,0 +1,86 @@
+import json
+
+from . import utils
+
+PID_CLIENT = 1
+PID_SERVER = 2
+
+# (pid, tid, name) of the tracks, one per pipeline stage so that frames only
+# overlap on a track when that stage is queueing
+TRACKS = [
+    (PID_CLIENT, 1, "input"),
+    (PID_SERVER, 1, "prediction"),
+    (PID_SERVER, 2, "simulation"),
+    (PID_SERVER, 3, "render"),
+    (PID_SERVER, 4, "encode"),
+    (PID_CLIENT, 2, "receive"),
+    (PID_CLIENT, 3, "decode"),
+    (PID_CLIENT, 4, "render")
+]
+
+
+def make_trace_events(feedback):
+    # everything is placed on the client clock, the server stamps are shifted so that
+    # startSimulation falls where the prediction was sent, which is -clockOffset when known
+    latency = utils.calc_latency_breakdown(feedback)
+    session = feedback['session']
+
+    gather_input = feedback['gatherInput']
+    start_prediction = gather_input + latency[1]
+    stop_prediction = start_prediction + latency[2]
+    server_offset = stop_prediction - feedback['startSimulation']
+
+    def span(track, name, start, end):
+        pid, tid, _ = TRACKS[track]
+        return {
+            'name': name, 'cat': 'frame', 'ph': 'X', 'pid': pid, 'tid': tid,
+            'ts': start * 1000, 'dur': max(0, end - start) * 1000, 'args': {'session': session}
+        }
+
+    def network(name, start, end):
+        # async events may overlap each other, frames in flight usually do
+        return [
+            {'name': name, 'cat': 'network', 'ph': 'b', 'id': session, 'pid': PID_CLIENT, 'ts': start * 1000},
+            {'name': name, 'cat': 'network', 'ph': 'e', 'id': session, 'pid': PID_CLIENT, 'ts': end * 1000}
+        ]
+
+    return [
+        span(0, "gather input", gather_input, gather_input),
+        *network("uplink", gather_input, start_prediction),
+        span(1, "predict", start_prediction, stop_prediction),
+        span(2, "simulate", stop_prediction, feedback['startServerRender'] + server_offset),
+        span(3, "render", feedback['startServerRender'] + server_offset, feedback['startEncode'] + server_offset),
+        span(4, "encode", feedback['startEncode'] + server_offset, feedback['sendVideo'] + server_offset),
+        *network("downlink", feedback['sendVideo'] + server_offset, feedback['firstFrameReceived']),
+        span(5, "wait decode", feedback['firstFrameReceived'], feedback['startDecode']),
+        span(6, "decode", feedback['startDecode'], feedback['startClientRender']),
+        span(7, "render", feedback['startClientRender'], feedback['endClientRender'])
+    ]
+
+
+class ChromeTraceWriter:
+    # streams the trace event json array so memory does not grow with the session
+    def __init__(self, output):
+        self.file = open(output, 'w')
+        self.file.write("[\n")
+        self.first = True
+
+        self.write_event({'name': 'process_name', 'ph': 'M', 'pid': PID_CLIENT, 'args': {'name': "client"}})
+        self.write_event({'name': 'process_name', 'ph': 'M', 'pid': PID_SERVER, 'args': {'name': "server"}})
+        for pid, tid, name in TRACKS:
+            self.write_event({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}})
+
+    def write_event(self, event):
+        if not self.first:
+            self.file.write(",\n")
+
+        self.file.write(json.dumps(event))
+        self.first = False
+
+    def write_feedback(self, feedback):
+        for event in make_trace_events(feedback):
+            self.write_event(event)
+
+    def close(self):
+        self.file.write("\n]\n")
+        self.file.close()
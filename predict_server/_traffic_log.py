@@ -0,0 +1,43 @@
+import struct
+import time
+
+CHANNEL_MOTION = 0
+CHANNEL_EXTERNAL_INPUT = 1
+CHANNEL_FEEDBACK = 2
+
+LOG_MAGIC = b'PSTL\x01'
+
+# receive time (ns), channel, length, followed by the raw frame
+RECORD_FORMAT = '<qBI'
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+
+
+class TrafficRecorder:
+    def __init__(self, output):
+        self.output = open(output, 'wb')
+        self.output.write(LOG_MAGIC)
+
+    def record(self, channel, frame):
+        self.output.write(struct.pack(RECORD_FORMAT, time.time_ns(), channel, len(frame)))
+        self.output.write(frame)
+
+    def close(self):
+        self.output.close()
+
+
+def read_traffic_log(path):
+    with open(path, 'rb') as f:
+        if f.read(len(LOG_MAGIC)) != LOG_MAGIC:
+            raise ValueError("not a traffic log: " + path)
+
+        while True:
+            header = f.read(RECORD_SIZE)
+            if len(header) < RECORD_SIZE:
+                return
+
+            timestamp, channel, length = struct.unpack(RECORD_FORMAT, header)
+            frame = f.read(length)
+            if len(frame) < length:
+                return
+
+            yield timestamp, channel, frame
@@ -0,0 +1,110 @@
+import os
+import struct
+
+TRANSPORTS = ('tcp', 'ipc', 'shm')
+
+
+def make_endpoint(transport, port, host="*"):
+    if transport == 'tcp':
+        return "tcp://{}:{}".format(host, port)
+
+    import tempfile
+
+    # shared memory only covers the motion path, everything else goes over ipc
+    return "ipc://" + os.path.join(tempfile.gettempdir(), "predict_server-" + str(port))
+
+
+class SharedMemoryRing:
+    # header : write count (Q), slot count (I), slot size (I)
+    # slot   : sequence (Q), length (I), padding (I), payload (slot size)
+    HEADER_FORMAT = '<QII'
+    HEADER_SIZE = 64
+    SLOT_HEADER_SIZE = 16
+    READ_RETRIES = 10000
+
+    def __init__(self, name, create=False, slot_count=64, slot_size=1024):
+        from multiprocessing import shared_memory
+
+        if create:
+            self.memory = shared_memory.SharedMemory(
+                name=name,
+                create=True,
+                size=self.HEADER_SIZE + slot_count * (self.SLOT_HEADER_SIZE + slot_size)
+            )
+            struct.pack_into(self.HEADER_FORMAT, self.memory.buf, 0, 0, slot_count, slot_size)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+            _, slot_count, slot_size = struct.unpack_from(self.HEADER_FORMAT, self.memory.buf, 0)
+
+            if os.name == 'posix':
+                # attaching registers the segment too, and the tracker would unlink the
+                # creator's ring when this process exits
+                from multiprocessing import resource_tracker
+
+                resource_tracker.unregister(self.memory._name, 'shared_memory')
+
+        self.owner = create
+        self.slot_count = slot_count
+        self.slot_size = slot_size
+        self.write_count = self.read_count = struct.unpack_from('<Q', self.memory.buf, 0)[0]
+
+    def slot_offset(self, count):
+        return self.HEADER_SIZE + (count % self.slot_count) * (self.SLOT_HEADER_SIZE + self.slot_size)
+
+    def write(self, data):
+        assert(len(data) <= self.slot_size)
+
+        buf = self.memory.buf
+        offset = self.slot_offset(self.write_count)
+
+        # seqlock : an odd sequence marks the slot as being written
+        seq = struct.unpack_from('<Q', buf, offset)[0]
+        struct.pack_into('<QI', buf, offset, seq + 1, len(data))
+
+        payload = offset + self.SLOT_HEADER_SIZE
+        buf[payload:payload + len(data)] = data
+
+        struct.pack_into('<Q', buf, offset, seq + 2)
+
+        self.write_count += 1
+        struct.pack_into('<Q', buf, 0, self.write_count)
+
+    def pending(self):
+        return struct.unpack_from('<Q', self.memory.buf, 0)[0] > self.read_count
+
+    def read(self):
+        buf = self.memory.buf
+        write_count = struct.unpack_from('<Q', buf, 0)[0]
+        if self.read_count >= write_count:
+            return None
+
+        # the writer has lapped us, skip to the oldest frame still in the ring
+        if write_count - self.read_count > self.slot_count:
+            self.read_count = write_count - self.slot_count
+
+        offset = self.slot_offset(self.read_count)
+        payload = offset + self.SLOT_HEADER_SIZE
+
+        for _ in range(self.READ_RETRIES):
+            seq, length = struct.unpack_from('<QI', buf, offset)
+            if seq & 1:
+                continue
+
+            data = bytes(buf[payload:payload + length])
+            if struct.unpack_from('<Q', buf, offset)[0] == seq:
+                self.read_count += 1
+                return data
+
+        # a writer that died mid-write leaves the slot odd for good, leave it to the next poll
+        # instead of holding up the event loop
+        return None
+
+    def close(self):
+        self.memory.close()
+
+        if self.owner:
+            try:
+                self.memory.unlink()
+            except FileNotFoundError:
+                # already cleaned up by someone else
+                pass
@@ -70,6 +70,26 @@ class MotionData:
         self.right_hand_angular_velocity = right_hand_angular_velocity
         self.right_hand_primary_button_press = right_hand_primary_button_press
 
+        # ids of the external inputs that changed since the previous frame
+        self.external_input_changes = ()
+
+    def pack(self):
+        return struct.pack(
+            '>q33fB',
+            self.timestamp,
+            *self.left_eye_position,
+            *self.right_eye_position,
+            *self.head_orientation,
+            *self.head_acceleration,
+            *self.head_angular_velocity,
+            *self.camera_projection,
+            *self.right_hand_position,
+            *self.right_hand_orientation,
+            *self.right_hand_acceleration,
+            *self.right_hand_angular_velocity,
+            1 if self.right_hand_primary_button_press else 0
+        )
+
     def fov(self):
         return math.atan(self.camera_projection[1]) + math.atan(-self.camera_projection[3])
 
@@ -86,6 +106,9 @@ class MotionData:
 
     
 class PredictedData:
+    # pack_with_inputs at its largest, with an input pressed on every one of the 256 device ids
+    MAX_PACKED_SIZE_WITH_INPUTS = struct.calcsize('>q49fH2B') + 2 + 256 * (1 + 32 + 32)
+
     def __init__(self,
                  timestamp,
                  prediction_time,
@@ -189,6 +212,17 @@ class PredictedData:
             1 if self.external_input_predicted_press else 0
         )
 
+    def pack_with_inputs(self, device_masks):
+        # followed by the number of devices with a pressed input, then for each device
+        # its id and 256-bit actual and predicted masks where bit n is button n
+        data = [self.pack(), struct.pack('>H', len(device_masks))]
+        for device, (actual_mask, predicted_mask) in sorted(device_masks.items()):
+            data.append(struct.pack('>B', device))
+            data.append(actual_mask.to_bytes(32, 'little'))
+            data.append(predicted_mask.to_bytes(32, 'little'))
+
+        return b''.join(data)
+
 class ExternalInputData:
     @classmethod
     def from_bytes(cls, bytes):
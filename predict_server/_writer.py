@@ -1,30 +1,19 @@
-import math
 from . import utils
+from ._recording import RecordingWriter, is_recording
+from ._rotating_output import RotatingOutput, split_compression
 
 from abc import abstractmethod, ABCMeta
 
-def quat_to_euler(x, y, z, w):
-    siny_cosp = 2 * (w * y - z * x)
-    cosy_cosp = 1 - 2 * (y * y + z * z)
-    yaw = math.atan2(siny_cosp, cosy_cosp)
-
-    sinp = 2 * (w * z + x * y)
-    if abs(sinp) >= 1:
-        roll = math.copysign(math.pi / 2, sinp)
-    else:
-        roll = math.asin(sinp)
-
-    sinx_cosp = 2 * (w * x - y * z)
-    cosx_cosp = 1 - 2 * (z * z + x * x)
-    pitch = math.atan2(sinx_cosp, cosx_cosp)
-
-    return [yaw, pitch, roll]    
-
-
 class CsvWriter(metaclass=ABCMeta):
-    def __init__(self, output):
-        self.output = open(output, 'w')
-        self.write_line(self.make_header_items())
+    def __init__(self, output, rotation=None):
+        # rotation holds RotatingOutput options (max_bytes, max_seconds, compression, retention),
+        # a .gz or .zst output name alone compresses without rotating
+        if rotation is None and split_compression(output)[1] is None:
+            self.output = open(output, 'w')
+            self.write_line(self.make_header_items())
+        else:
+            header = ','.join(self.make_header_items()) + '\n'
+            self.output = RotatingOutput(output, header, **(rotation or {}))
 
     def write_line(self, items):
         self.output.write(','.join(items) + '\n')
@@ -33,14 +22,102 @@ class CsvWriter(metaclass=ABCMeta):
     def close(self):
         self.output.close()
 
+    def queued(self):
+        # lines waiting for the rotating output's worker thread
+        return self.output.queued() if isinstance(self.output, RotatingOutput) else 0
+
     @abstractmethod
     def make_header_items(self):
         pass
 
-    
-class PredictionOutputWriter(CsvWriter):
-    def __init__(self, output):
-        super().__init__(output)
+
+class NumericCsvWriter(CsvWriter):
+    # rows are buffered as numbers and written in bulk, with the euler angle
+    # columns (*_yaw, *_pitch, *_roll) computed for the whole buffer at once
+    integer_items = ()
+
+    def __init__(self, output, flush_rows=72, rotation=None):
+        header = self.make_header_items()
+        self.flush_rows = flush_rows
+        self.pending_timestamps = []
+        self.pending_values = []
+        self.pending_quaternions = []
+
+        # the first column is the timestamp, kept as an integer outside the value matrix
+        self.column_count = len(header) - 1
+        self.euler_columns = [
+            index for index, item in enumerate(header[1:])
+            if item.endswith(('_yaw', '_pitch', '_roll'))
+        ]
+        self.value_columns = [
+            index for index in range(self.column_count) if index not in self.euler_columns
+        ]
+        self.integer_columns = [
+            index for index, item in enumerate(header[1:]) if item in self.integer_items
+        ]
+
+        # numeric rows can go to a memory-mappable binary recording instead of csv
+        if is_recording(output):
+            self.output = None
+            self.recording = RecordingWriter(output, header)
+        else:
+            self.recording = None
+            super().__init__(output, rotation)
+
+    def write_values(self, timestamp, values, quaternions):
+        self.pending_timestamps.append(timestamp)
+        self.pending_values.append(values)
+        # copied now, a module may reuse its output lists before the flush
+        self.pending_quaternions.extend(tuple(quaternion) for quaternion in quaternions)
+
+        if len(self.pending_timestamps) >= self.flush_rows:
+            self.flush()
+
+    def queued(self):
+        return len(self.pending_timestamps) + (super().queued() if self.output is not None else 0)
+
+    def flush(self):
+        if len(self.pending_timestamps) == 0:
+            return
+
+        import numpy as np
+
+        rows = np.empty((len(self.pending_timestamps), self.column_count))
+        rows[:, self.value_columns] = self.pending_values
+        rows[:, self.euler_columns] = utils.quat_to_euler_array(
+            np.array(self.pending_quaternions, dtype=np.float64)
+        ).reshape(len(rows), -1)
+
+        if self.recording is not None:
+            self.recording.write_rows(self.pending_timestamps, rows)
+            self.recording.flush()
+        else:
+            lines = []
+            for timestamp, row in zip(self.pending_timestamps, rows.tolist()):
+                for index in self.integer_columns:
+                    row[index] = int(row[index])
+
+                lines.append(str(timestamp) + ',' + ','.join(map(str, row)) + '\n')
+
+            self.output.write(''.join(lines))
+            self.output.flush()
+
+        self.pending_timestamps = []
+        self.pending_values = []
+        self.pending_quaternions = []
+
+    def close(self):
+        self.flush()
+
+        if self.recording is not None:
+            self.recording.close()
+        else:
+            super().close()
+
+
+class PredictionOutputWriter(NumericCsvWriter):
+    def __init__(self, output, rotation=None):
+        super().__init__(output, rotation=rotation)
 
     def make_header_items(self):
         return [
@@ -121,112 +198,81 @@ class PredictionOutputWriter(CsvWriter):
         ]
 
     def write(self, motion_data, predicted_data):
-        input_head_orientation_euler = quat_to_euler(
+        self.write_values(motion_data.timestamp, [
+            motion_data.left_eye_position[0],
+            motion_data.left_eye_position[1],
+            motion_data.left_eye_position[2],
+            motion_data.right_eye_position[0],
+            motion_data.right_eye_position[1],
+            motion_data.right_eye_position[2],
             motion_data.head_orientation[0],
             motion_data.head_orientation[1],
             motion_data.head_orientation[2],
-            motion_data.head_orientation[3] 
-        )
-        predicted_head_orientation_euler = quat_to_euler(
-            predicted_data.predicted_head_orientation[0],
-            predicted_data.predicted_head_orientation[1],
-            predicted_data.predicted_head_orientation[2],
-            predicted_data.predicted_head_orientation[3]
-        )
-        input_right_hand_orientation_euler = quat_to_euler(
+            motion_data.head_orientation[3],
+            motion_data.head_acceleration[0],
+            motion_data.head_acceleration[1],
+            motion_data.head_acceleration[2],
+            motion_data.head_angular_velocity[0],
+            motion_data.head_angular_velocity[1],
+            motion_data.head_angular_velocity[2],
+            motion_data.camera_projection[0],
+            motion_data.camera_projection[1],
+            motion_data.camera_projection[2],
+            motion_data.camera_projection[3],
+            motion_data.right_hand_position[0],
+            motion_data.right_hand_position[1],
+            motion_data.right_hand_position[2],
             motion_data.right_hand_orientation[0],
             motion_data.right_hand_orientation[1],
             motion_data.right_hand_orientation[2],
-            motion_data.right_hand_orientation[3]
-        )
-        predicted_right_hand_orientation_euler = quat_to_euler(
+            motion_data.right_hand_orientation[3],
+            motion_data.right_hand_acceleration[0],
+            motion_data.right_hand_acceleration[1],
+            motion_data.right_hand_acceleration[2],
+            motion_data.right_hand_angular_velocity[0],
+            motion_data.right_hand_angular_velocity[1],
+            motion_data.right_hand_angular_velocity[2],
+            predicted_data.prediction_time,
+            predicted_data.predicted_left_eye_position[0],
+            predicted_data.predicted_left_eye_position[1],
+            predicted_data.predicted_left_eye_position[2],
+            predicted_data.predicted_right_eye_position[0],
+            predicted_data.predicted_right_eye_position[1],
+            predicted_data.predicted_right_eye_position[2],
+            predicted_data.predicted_head_orientation[0],
+            predicted_data.predicted_head_orientation[1],
+            predicted_data.predicted_head_orientation[2],
+            predicted_data.predicted_head_orientation[3],
+            predicted_data.predicted_left_camera_projection[0],
+            predicted_data.predicted_left_camera_projection[1],
+            predicted_data.predicted_left_camera_projection[2],
+            predicted_data.predicted_left_camera_projection[3],
+            predicted_data.predicted_right_camera_projection[0],
+            predicted_data.predicted_right_camera_projection[1],
+            predicted_data.predicted_right_camera_projection[2],
+            predicted_data.predicted_right_camera_projection[3],
+            predicted_data.predicted_foveation_inner_radius,
+            predicted_data.predicted_foveation_middle_radius,
+            predicted_data.predicted_right_hand_position[0],
+            predicted_data.predicted_right_hand_position[1],
+            predicted_data.predicted_right_hand_position[2],
             predicted_data.predicted_right_hand_orientation[0],
             predicted_data.predicted_right_hand_orientation[1],
             predicted_data.predicted_right_hand_orientation[2],
             predicted_data.predicted_right_hand_orientation[3]
-        )
-        
-        self.write_line([
-            str(motion_data.timestamp),
-            str(motion_data.left_eye_position[0]),
-            str(motion_data.left_eye_position[1]),
-            str(motion_data.left_eye_position[2]),
-            str(motion_data.right_eye_position[0]),
-            str(motion_data.right_eye_position[1]),
-            str(motion_data.right_eye_position[2]),
-            str(motion_data.head_orientation[0]),
-            str(motion_data.head_orientation[1]),
-            str(motion_data.head_orientation[2]),
-            str(motion_data.head_orientation[3]),
-            str(input_head_orientation_euler[0]),
-            str(input_head_orientation_euler[1]),
-            str(input_head_orientation_euler[2]),
-            str(motion_data.head_acceleration[0]),
-            str(motion_data.head_acceleration[1]),
-            str(motion_data.head_acceleration[2]),
-            str(motion_data.head_angular_velocity[0]),
-            str(motion_data.head_angular_velocity[1]),
-            str(motion_data.head_angular_velocity[2]),
-            str(motion_data.camera_projection[0]),
-            str(motion_data.camera_projection[1]),
-            str(motion_data.camera_projection[2]),
-            str(motion_data.camera_projection[3]),
-            str(motion_data.right_hand_position[0]),
-            str(motion_data.right_hand_position[1]),
-            str(motion_data.right_hand_position[2]),
-            str(input_right_hand_orientation_euler[0]),
-            str(input_right_hand_orientation_euler[1]),
-            str(input_right_hand_orientation_euler[2]),
-            str(motion_data.right_hand_orientation[0]),
-            str(motion_data.right_hand_orientation[1]),
-            str(motion_data.right_hand_orientation[2]),
-            str(motion_data.right_hand_orientation[3]),
-            str(motion_data.right_hand_acceleration[0]),
-            str(motion_data.right_hand_acceleration[1]),
-            str(motion_data.right_hand_acceleration[2]),
-            str(motion_data.right_hand_angular_velocity[0]),
-            str(motion_data.right_hand_angular_velocity[1]),
-            str(motion_data.right_hand_angular_velocity[2]),
-            str(predicted_data.prediction_time),
-            str(predicted_data.predicted_left_eye_position[0]),
-            str(predicted_data.predicted_left_eye_position[1]),
-            str(predicted_data.predicted_left_eye_position[2]),
-            str(predicted_data.predicted_right_eye_position[0]),
-            str(predicted_data.predicted_right_eye_position[1]),
-            str(predicted_data.predicted_right_eye_position[2]),
-            str(predicted_data.predicted_head_orientation[0]),
-            str(predicted_data.predicted_head_orientation[1]),
-            str(predicted_data.predicted_head_orientation[2]),
-            str(predicted_data.predicted_head_orientation[3]),
-            str(predicted_head_orientation_euler[0]),
-            str(predicted_head_orientation_euler[1]),
-            str(predicted_head_orientation_euler[2]),
-            str(predicted_data.predicted_left_camera_projection[0]),
-            str(predicted_data.predicted_left_camera_projection[1]),
-            str(predicted_data.predicted_left_camera_projection[2]),
-            str(predicted_data.predicted_left_camera_projection[3]),
-            str(predicted_data.predicted_right_camera_projection[0]),
-            str(predicted_data.predicted_right_camera_projection[1]),
-            str(predicted_data.predicted_right_camera_projection[2]),
-            str(predicted_data.predicted_right_camera_projection[3]),
-            str(predicted_data.predicted_foveation_inner_radius),
-            str(predicted_data.predicted_foveation_middle_radius),
-            str(predicted_data.predicted_right_hand_position[0]),
-            str(predicted_data.predicted_right_hand_position[1]),
-            str(predicted_data.predicted_right_hand_position[2]),
-            str(predicted_data.predicted_right_hand_orientation[0]),
-            str(predicted_data.predicted_right_hand_orientation[1]),
-            str(predicted_data.predicted_right_hand_orientation[2]),
-            str(predicted_data.predicted_right_hand_orientation[3]),
-            str(predicted_right_hand_orientation_euler[0]),
-            str(predicted_right_hand_orientation_euler[1]),
-            str(predicted_right_hand_orientation_euler[2])
+        ], [
+            motion_data.head_orientation,
+            motion_data.right_hand_orientation,
+            predicted_data.predicted_head_orientation,
+            predicted_data.predicted_right_hand_orientation
         ])
 
         
-class PerfMetricWriter(CsvWriter):
-    def __init__(self, output):
-        super().__init__(output)
+class PerfMetricWriter(NumericCsvWriter):
+    integer_items = ('frame_type', 'frame_size')
+
+    def __init__(self, output, rotation=None):
+        super().__init__(output, rotation=rotation)
 
     def make_header_items(self):
         return [
@@ -257,16 +303,7 @@ class PerfMetricWriter(CsvWriter):
             'predicted_right_projection_top',
             'predicted_right_projection_right',
             'predicted_right_projection_bottom',
-            'overall_latency',
-            'gather_input_start_prediction',
-            'start_prediction_send_predicted',
-            'send_predicted_start_server_render',
-            'start_server_render_start_encode',
-            'start_encode_send_video',
-            'send_video_start_recv_video',
-            'start_recv_video_start_decode',
-            'start_decode_start_client_render',
-            'start_client_render_end_client_render',
+        ] + utils.LATENCY_ITEMS + [
             'frame_type',
             'frame_size',
             'optimal_overhead',
@@ -274,142 +311,58 @@ class PerfMetricWriter(CsvWriter):
         ]
 
     def write_metric(self, feedback):
-        # latency
-        overall_latency = feedback['endClientRender'] - feedback['gatherInput']
-        
-        start_prediction_send_predicted = \
-            feedback['stopPrediction'] - feedback['startPrediction']
-        send_predicted_start_server_render = \
-            feedback['startServerRender'] - feedback['startSimulation']
-        start_server_render_start_encode = \
-            feedback['startEncode'] - feedback['startServerRender']
-        start_encode_send_video = \
-            feedback['sendVideo'] - feedback['startEncode']
-        start_recv_video_start_decode = \
-            feedback['startDecode'] - feedback['firstFrameReceived']
-        start_decode_start_client_render = \
-            feedback['startClientRender'] - feedback['startDecode']
-        start_client_render_end_client_render = \
-            feedback['endClientRender'] - feedback['startClientRender']
-        
-        rtt = overall_latency - (
-            start_prediction_send_predicted +
-            send_predicted_start_server_render +
-            start_server_render_start_encode +
-            start_encode_send_video +
-            start_recv_video_start_decode +
-            start_decode_start_client_render +
-            start_client_render_end_client_render
-        )
-
-        gather_input_start_prediction = send_video_start_recv_video = rtt / 2
-
-        # overhead
+        latency = utils.calc_latency_breakdown(feedback)
+
+        optimal_overhead, actual_overhead = utils.calc_overheads(feedback)
+
         hmd_orientation = [
             feedback['hmdOrientationW'],
             -feedback['hmdOrientationX'],
             -feedback['hmdOrientationY'],
             feedback['hmdOrientationZ'],
         ]
-        left_eye_projection = [
-            feedback['hmdProjectionL'],
-            feedback['hmdProjectionT'],
-            feedback['hmdProjectionR'],
-            feedback['hmdProjectionB']
-        ]
         frame_orientation = [
             feedback['frameOrientationW'],
             -feedback['frameOrientationX'],
             -feedback['frameOrientationY'],
             feedback['frameOrientationZ']
         ]
-        left_frame_projection = [
+
+        self.write_values(feedback['session'], [
+            -feedback['hmdOrientationX'],
+            -feedback['hmdOrientationY'],
+            feedback['hmdOrientationZ'],
+            feedback['hmdOrientationW'],
+            feedback['hmdProjectionL'],
+            feedback['hmdProjectionT'],
+            feedback['hmdProjectionR'],
+            feedback['hmdProjectionB'],
+            -feedback['frameOrientationX'],
+            -feedback['frameOrientationY'],
+            feedback['frameOrientationZ'],
+            feedback['frameOrientationW'],
             feedback['frameProjectionLL'],
             feedback['frameProjectionLT'],
             feedback['frameProjectionLR'],
-            feedback['frameProjectionLB']
-        ]
-        right_frame_projection = [
+            feedback['frameProjectionLB'],
             feedback['frameProjectionRL'],
             feedback['frameProjectionRT'],
             feedback['frameProjectionRR'],
-            feedback['frameProjectionRB']
-        ]
-
-        left_optimal_overhead = utils.calc_overhead(
-            left_eye_projection,
-            utils.calc_optimal_projection(hmd_orientation, frame_orientation, left_eye_projection)
-        )
-        left_actual_overhead = utils.calc_overhead(left_eye_projection, left_frame_projection)
-        
-        right_eye_projection = utils.make_other_eye_projection(left_eye_projection)
-        right_optimal_overhead = utils.calc_overhead(
-            right_eye_projection,
-            utils.calc_optimal_projection(hmd_orientation, frame_orientation, right_eye_projection)
-        )
-        right_actual_overhead = utils.calc_overhead(right_eye_projection, right_frame_projection)
-
-        hmd_orientation_euler = quat_to_euler(
-            hmd_orientation[1],
-            hmd_orientation[2],
-            hmd_orientation[3],
-            hmd_orientation[0]
-        )
-        frame_orientation_euler = quat_to_euler(
-            frame_orientation[1],
-            frame_orientation[2],
-            frame_orientation[3],
-            frame_orientation[0]
-        )
-
-        self.write_line([
-            str(feedback['session']),
-            str(-feedback['hmdOrientationX']),
-            str(-feedback['hmdOrientationY']),
-            str(feedback['hmdOrientationZ']),
-            str(feedback['hmdOrientationW']),
-            str(hmd_orientation_euler[0]),
-            str(hmd_orientation_euler[1]),
-            str(hmd_orientation_euler[2]),
-            str(feedback['hmdProjectionL']),
-            str(feedback['hmdProjectionT']),
-            str(feedback['hmdProjectionR']),
-            str(feedback['hmdProjectionB']),
-            str(-feedback['frameOrientationX']),
-            str(-feedback['frameOrientationY']),
-            str(feedback['frameOrientationZ']),
-            str(feedback['frameOrientationW']),
-            str(frame_orientation_euler[0]),
-            str(frame_orientation_euler[1]),
-            str(frame_orientation_euler[2]),
-            str(feedback['frameProjectionLL']),
-            str(feedback['frameProjectionLT']),
-            str(feedback['frameProjectionLR']),
-            str(feedback['frameProjectionLB']),
-            str(feedback['frameProjectionRL']),
-            str(feedback['frameProjectionRT']),
-            str(feedback['frameProjectionRR']),
-            str(feedback['frameProjectionRB']),
-            str(overall_latency),
-            str(gather_input_start_prediction),
-            str(start_prediction_send_predicted),
-            str(send_predicted_start_server_render),
-            str(start_server_render_start_encode),
-            str(start_encode_send_video),
-            str(send_video_start_recv_video),
-            str(start_recv_video_start_decode),
-            str(start_decode_start_client_render),
-            str(start_client_render_end_client_render),
-            str("{:.0f}".format(feedback['frameType'])),
-            str("{:.0f}".format(feedback['frameSize'])),
-            str((left_optimal_overhead + right_optimal_overhead) / 2),
-            str((left_actual_overhead + right_actual_overhead) / 2)
+            feedback['frameProjectionRB'],
+            *latency,
+            round(feedback['frameType']),
+            round(feedback['frameSize']),
+            optimal_overhead,
+            actual_overhead
+        ], [
+            hmd_orientation[1:] + hmd_orientation[:1],
+            frame_orientation[1:] + frame_orientation[:1]
         ])
 
 
 class GameEventWriter(CsvWriter):
-    def __init__(self, output):
-        super().__init__(output)
+    def __init__(self, output, rotation=None):
+        super().__init__(output, rotation=rotation)
 
     def make_header_items(self):
         return [
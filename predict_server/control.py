@@ -0,0 +1,49 @@
+import sys
+import getopt
+import zmq
+
+from ._transport import make_endpoint
+
+
+def send_command(command, host="localhost", port_input=5555, transport='tcp'):
+    if transport == 'tcp':
+        endpoint = "tcp://{}:{}".format(host, port_input + 3)
+    else:
+        endpoint = make_endpoint('ipc', port_input + 3)
+
+    socket = zmq.Context.instance().socket(zmq.PUSH)
+    socket.connect(endpoint)
+    socket.send(command.encode('utf-8'))
+    socket.close(linger=1000)
+
+
+def main():
+    host = "localhost"
+    port = 5555
+    transport = 'tcp'
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "h:p:t:")
+    except getopt.GetoptError as err:
+        print(err)
+        sys.exit(1)
+
+    for opt, arg in opts:
+        if opt == "-h":
+            host = arg
+        elif opt == "-p":
+            port = int(arg)
+        elif opt == "-t":
+            transport = arg
+        else:
+            assert False, "unhandled option"
+
+    if len(args) == 0:
+        print("usage: python -m predict_server.control [-h host] [-p port] [-t transport] <command> [argument]")
+        sys.exit(1)
+
+    send_command(" ".join(args), host, port, transport)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import getopt
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from numpy.lib.stride_tricks import sliding_window_view
+
+from ._recording import RecordingReader, is_recording
+from ._rotating_output import segment_paths, open_text
+
+
+def expand(prefix, suffixes):
+    return [prefix + '_' + suffix for suffix in suffixes]
+
+
+# the MotionData channels as written by PredictionOutputWriter
+MOTION_COLUMNS = \
+    expand('input_left_eye_position', 'xyz') + \
+    expand('input_right_eye_position', 'xyz') + \
+    expand('input_head_orientation', 'xyzw') + \
+    expand('input_head_acceleration', 'xyz') + \
+    expand('input_head_angular_vec', 'xyz') + \
+    expand('input_camera_projection', ('left', 'top', 'right', 'bottom')) + \
+    expand('input_right_hand_position', 'xyz') + \
+    expand('input_right_hand_orientation', 'xyzw') + \
+    expand('input_right_hand_acceleration', 'xyz') + \
+    expand('input_right_hand_angular_vec', 'xyz')
+
+POSE_COLUMNS = \
+    expand('input_left_eye_position', 'xyz') + \
+    expand('input_right_eye_position', 'xyz') + \
+    expand('input_head_orientation', 'xyzw') + \
+    expand('input_right_hand_position', 'xyz') + \
+    expand('input_right_hand_orientation', 'xyzw')
+
+
+def iter_chunks(path, columns, chunk_rows=16384):
+    # chunk_rows x len(columns) arrays, read without loading the whole recording
+    if is_recording(path):
+        records = RecordingReader(path).records
+        for start in range(0, len(records), chunk_rows):
+            chunk = records[start:start + chunk_rows]
+            yield np.stack([chunk[column] for column in columns], axis=1).astype(np.float64)
+        return
+
+    for segment in segment_paths(path):
+        with open_text(segment) as f:
+            header = f.readline().strip().split(',')
+            indices = [header.index(column) for column in columns]
+
+            while True:
+                lines = list(itertools.islice(f, chunk_rows))
+                if len(lines) == 0:
+                    break
+
+                yield np.loadtxt(lines, delimiter=',', usecols=indices, ndmin=2)
+
+
+def iter_windows(path, length=36, stride=1, horizon=7, batch_size=4096,
+                 input_columns=MOTION_COLUMNS, target_columns=POSE_COLUMNS, chunk_rows=16384):
+    # yields (inputs, targets) batches of batch_size x length x channels and batch_size x channels,
+    # the target is the row horizon rows after the last row of its window
+    columns = list(dict.fromkeys(input_columns + target_columns))
+    input_indices = [columns.index(column) for column in input_columns]
+    target_indices = [columns.index(column) for column in target_columns]
+
+    batch_inputs = np.empty((batch_size, length, len(input_indices)))
+    batch_targets = np.empty((batch_size, len(target_indices)))
+    filled = 0
+
+    # rows kept from earlier chunks for windows that straddle a chunk boundary
+    carry = np.empty((0, len(columns)))
+    carry_start = 0
+    next_start = 0
+
+    for chunk in iter_chunks(path, columns, chunk_rows):
+        rows = np.concatenate([carry, chunk])
+        starts = np.arange(next_start - carry_start, len(rows) - length - horizon + 1, stride)
+
+        if len(starts) > 0:
+            windows = sliding_window_view(rows[:, input_indices], length, axis=0)
+
+            position = 0
+            while position < len(starts):
+                taken = starts[position:position + batch_size - filled]
+                batch_inputs[filled:filled + len(taken)] = windows[taken].transpose(0, 2, 1)
+                batch_targets[filled:filled + len(taken)] = rows[taken + length - 1 + horizon][:, target_indices]
+
+                filled += len(taken)
+                position += len(taken)
+
+                if filled == batch_size:
+                    yield batch_inputs.copy(), batch_targets.copy()
+                    filled = 0
+
+            next_start = carry_start + starts[-1] + stride
+
+        keep = min(next_start - carry_start, len(rows))
+        carry = rows[keep:]
+        carry_start += keep
+
+    if filled > 0:
+        yield batch_inputs[:filled].copy(), batch_targets[:filled].copy()
+
+
+def write_shards(path, output_prefix, **options):
+    # one pair of .npy files per batch, returns the number of windows written
+    count = 0
+    for index, (inputs, targets) in enumerate(iter_windows(path, **options)):
+        np.save("{}-{:05d}-inputs.npy".format(output_prefix, index), inputs)
+        np.save("{}-{:05d}-targets.npy".format(output_prefix, index), targets)
+        count += len(inputs)
+
+    return count
+
+
+def build_dataset(paths, output_dir, workers=None, **options):
+    # recordings are windowed in parallel, one process each
+    os.makedirs(output_dir, exist_ok=True)
+
+    # numbered, recordings from different directories may share a name
+    prefixes = [
+        os.path.join(output_dir, "{:03d}-{}".format(index, os.path.basename(path).split('.')[0]))
+        for index, path in enumerate(paths)
+    ]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(write_shards, path, prefix, **options) for path, prefix in zip(paths, prefixes)
+        ]
+        counts = {path: future.result() for path, future in zip(paths, futures)}
+
+    with open(os.path.join(output_dir, "dataset.json"), 'w') as f:
+        json.dump({
+            'input_columns': options.get('input_columns', MOTION_COLUMNS),
+            'target_columns': options.get('target_columns', POSE_COLUMNS),
+            'length': options.get('length', 36),
+            'stride': options.get('stride', 1),
+            'horizon': options.get('horizon', 7),
+            'windows': counts
+        }, f, indent=2)
+
+    return counts
+
+
+def main():
+    output_dir = None
+    workers = None
+    options = {}
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "o:l:s:z:b:j:")
+    except getopt.GetoptError as err:
+        print(err)
+        sys.exit(1)
+
+    for opt, arg in opts:
+        if opt == "-o":
+            output_dir = arg
+        elif opt == "-l":
+            options['length'] = int(arg)
+        elif opt == "-s":
+            options['stride'] = int(arg)
+        elif opt == "-z":
+            options['horizon'] = int(arg)
+        elif opt == "-b":
+            options['batch_size'] = int(arg)
+        elif opt == "-j":
+            workers = int(arg)
+        else:
+            assert False, "unhandled option"
+
+    if output_dir is None or len(args) == 0:
+        print("usage: python -m predict_server.dataset -o <output dir> [-l length] [-s stride] "
+              "[-z horizon] [-b batch size] [-j workers] <recording>...")
+        sys.exit(1)
+
+    for path, count in build_dataset(args, output_dir, workers, **options).items():
+        print("{}: {} windows".format(path, count), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import numpy as np
+
+from ._recording import RecordingReader, is_recording
+from ._rotating_output import segment_paths, open_text
+from .simulator import MotionPredictSimulator
+
+PERCENTILES = (50, 95, 99, 99.9)
+
+POSITIONS = ('left_eye_position', 'right_eye_position', 'right_hand_position')
+ORIENTATIONS = ('head_orientation', 'right_hand_orientation')
+PROJECTIONS = ('left_camera_projection', 'right_camera_projection')
+
+
+def load_columns(path):
+    if is_recording(path):
+        records = RecordingReader(path).records
+        return {name: records[name] for name in records.dtype.names}
+
+    segments = []
+    for segment in segment_paths(path):
+        with open_text(segment) as f:
+            header = f.readline().strip().split(',')
+            values = np.loadtxt(f, delimiter=',', ndmin=2)
+            if len(values) > 0:
+                segments.append(values)
+
+    # header-only or empty output, left to the row count check in evaluate
+    values = np.concatenate(segments) if len(segments) > 0 else np.empty((0, len(header)))
+    return {name: values[:, index] for index, name in enumerate(header)}
+
+
+def stack_columns(columns, prefix, suffixes):
+    return np.stack([columns[prefix + '_' + suffix] for suffix in suffixes], axis=1)
+
+
+def position_error(predicted, actual):
+    return np.linalg.norm(predicted - actual, axis=1)
+
+
+def angular_error(predicted, actual):
+    predicted = predicted / np.linalg.norm(predicted, axis=1, keepdims=True)
+    actual = actual / np.linalg.norm(actual, axis=1, keepdims=True)
+
+    dot = np.abs(np.einsum('ij,ij->i', predicted, actual))
+    return 2 * np.arccos(np.clip(dot, 0, 1))
+
+
+def projection_overhead(eye_projection, frame_projection):
+    a_eye = (eye_projection[:, 2] - eye_projection[:, 0]) * (eye_projection[:, 1] - eye_projection[:, 3])
+    a_frame = (frame_projection[:, 2] - frame_projection[:, 0]) * (frame_projection[:, 1] - frame_projection[:, 3])
+
+    return a_frame / a_eye - 1
+
+
+def summarize(values, percentiles=PERCENTILES):
+    if len(values) == 0:
+        return {'count': 0}
+
+    summary = {'count': len(values), 'mean': float(np.mean(values))}
+    for percentile, value in zip(percentiles, np.percentile(values, percentiles)):
+        summary['p{:g}'.format(percentile)] = float(value)
+
+    return summary
+
+
+class PredictionEvaluator:
+    # prediction_time is in milliseconds, timestamps are in the client's units
+    def __init__(self, prediction_output, timestamp_units_per_ms=1.0):
+        self.prediction_output = prediction_output
+        self.timestamp_units_per_ms = timestamp_units_per_ms
+
+    def align(self, columns):
+        timestamps = columns['timestamp'].astype(np.float64)
+        targets = timestamps + columns['prediction_time'] * self.timestamp_units_per_ms
+
+        # predictions reaching past the end of the recording have no ground truth
+        valid = np.nonzero(targets <= timestamps[-1])[0]
+        targets = targets[valid]
+
+        after = np.clip(np.searchsorted(timestamps, targets, 'left'), 1, len(timestamps) - 1)
+        before = after - 1
+        nearest = np.where(targets - timestamps[before] <= timestamps[after] - targets, before, after)
+
+        return valid, nearest
+
+    def evaluate(self, percentiles=PERCENTILES):
+        columns = load_columns(self.prediction_output)
+        if len(columns.get('timestamp', ())) < 2:
+            return {}
+
+        predicted, actual = self.align(columns)
+        errors = {}
+
+        for name in POSITIONS:
+            errors[name + '_error'] = position_error(
+                stack_columns(columns, 'predicted_' + name, 'xyz')[predicted],
+                stack_columns(columns, 'input_' + name, 'xyz')[actual]
+            )
+
+        for name in ORIENTATIONS:
+            errors[name + '_error'] = angular_error(
+                stack_columns(columns, 'predicted_' + name, 'xyzw')[predicted],
+                stack_columns(columns, 'input_' + name, 'xyzw')[actual]
+            )
+
+        sides = ('left', 'top', 'right', 'bottom')
+        left_eye_projection = stack_columns(columns, 'input_camera_projection', sides)[actual]
+        right_eye_projection = left_eye_projection[:, [2, 1, 0, 3]] * [-1, 1, -1, 1]
+
+        for name, eye_projection in zip(PROJECTIONS, (left_eye_projection, right_eye_projection)):
+            errors[name + '_overhead'] = projection_overhead(
+                eye_projection,
+                stack_columns(columns, 'predicted_' + name, sides)[predicted]
+            )
+
+        return {name: summarize(values, percentiles) for name, values in errors.items()}
+
+
+def evaluate_predictor(module, input_motion_data, prediction_output, time_range=None, timestamp_units_per_ms=1.0):
+    simulator = MotionPredictSimulator(module, input_motion_data, prediction_output, time_range)
+    simulator.run()
+    simulator.prediction_output.close()
+
+    return PredictionEvaluator(prediction_output, timestamp_units_per_ms).evaluate()
+
+
+def print_evaluation(result):
+    for name, summary in result.items():
+        print("{}: {}".format(
+            name, ", ".join("{} {:.6g}".format(key, value) for key, value in summary.items())
+        ), flush=True)
@@ -0,0 +1,129 @@
+import sys
+import time
+import getopt
+import zmq
+
+from ._traffic_log import CHANNEL_MOTION, CHANNEL_EXTERNAL_INPUT, CHANNEL_FEEDBACK, read_traffic_log
+from ._transport import TRANSPORTS, SharedMemoryRing, make_endpoint
+
+
+class TrafficReplayer:
+    def __init__(self, traffic_log, host, port_input, port_feedback, transport='tcp', speed=1.0):
+        assert(transport in TRANSPORTS)
+
+        self.traffic_log = traffic_log
+        self.host = host
+        self.port_input = port_input
+        self.port_feedback = port_feedback
+        self.transport = transport
+        self.speed = speed
+
+    def connect_endpoint(self, port):
+        if self.transport == 'tcp':
+            return "tcp://{}:{}".format(self.host, port)
+
+        # the server binds ipc endpoints for the shm transport too
+        return make_endpoint('ipc', port)
+
+    def run(self):
+        context = zmq.Context.instance()
+        sockets = {}
+        for channel, port in ((CHANNEL_EXTERNAL_INPUT, self.port_input + 2),
+                              (CHANNEL_FEEDBACK, self.port_feedback)):
+            sockets[channel] = context.socket(zmq.PUSH)
+            sockets[channel].connect(self.connect_endpoint(port))
+
+        if self.transport == 'shm':
+            ring = SharedMemoryRing("predict_server-" + str(self.port_input) + "-motion")
+            send_motion = ring.write
+        else:
+            ring = None
+            sockets[CHANNEL_MOTION] = context.socket(zmq.PUSH)
+            sockets[CHANNEL_MOTION].connect(self.connect_endpoint(self.port_input))
+            send_motion = sockets[CHANNEL_MOTION].send
+
+        # drain whatever the server sends back so its PUSH socket never blocks
+        socket_predicted = None
+        if self.transport != 'shm':
+            socket_predicted = context.socket(zmq.PULL)
+            socket_predicted.connect(self.connect_endpoint(self.port_input + 1))
+
+        first_recorded = first_sent = None
+        count = 0
+
+        try:
+            for timestamp, channel, frame in read_traffic_log(self.traffic_log):
+                if self.speed > 0:
+                    if first_recorded is None:
+                        first_recorded, first_sent = timestamp, time.perf_counter_ns()
+
+                    due = first_sent + (timestamp - first_recorded) / self.speed
+                    remaining = due - time.perf_counter_ns()
+                    if remaining > 2_000_000:
+                        time.sleep((remaining - 1_000_000) / 1e9)
+                    while time.perf_counter_ns() < due:
+                        pass
+
+                if channel == CHANNEL_MOTION:
+                    send_motion(frame)
+                else:
+                    sockets[channel].send(frame)
+                count += 1
+
+                if socket_predicted is not None:
+                    while socket_predicted.poll(0):
+                        socket_predicted.recv()
+        finally:
+            for socket in sockets.values():
+                socket.close(linger=1000)
+            if socket_predicted is not None:
+                socket_predicted.close(linger=0)
+            if ring is not None:
+                ring.close()
+
+        return count
+
+
+def main():
+    host = "localhost"
+    port = 5555
+    feedback = 5554
+    transport = 'tcp'
+    speed = 1.0
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "h:p:f:t:s:")
+    except getopt.GetoptError as err:
+        print(err)
+        sys.exit(1)
+
+    for opt, arg in opts:
+        if opt == "-h":
+            host = arg
+        elif opt == "-p":
+            port = int(arg)
+        elif opt == "-f":
+            feedback = int(arg)
+        elif opt == "-t":
+            transport = arg
+        elif opt == "-s":
+            # 0 replays as fast as possible
+            speed = float(arg)
+        else:
+            assert False, "unhandled option"
+
+    if len(args) != 1:
+        print("usage: python -m predict_server.replayer [-h host] [-p port] [-f feedback] [-t transport] [-s speed] <traffic log>")
+        sys.exit(1)
+
+    replayer = TrafficReplayer(args[0], host, port, feedback, transport, speed)
+
+    try:
+        count = replayer.run()
+        print("replayed {} frames".format(count), flush=True)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
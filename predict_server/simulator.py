@@ -1,74 +1,171 @@
-import csv
-from ._types import MotionData, PredictedData
+import time
+import asyncio
+import collections
+
+from ._types import MotionData
 from ._writer import PredictionOutputWriter
+from ._recording import RecordingReader, is_recording
+from ._rotating_output import read_csv_rows
+from ._motion_data_transport import MotionDataTransport
+from ._external_input import ExternalInput
+
+STAGES = ['decode', 'predict', 'build', 'send', 'output', 'total']
+
+
+def make_motion_data(row):
+    return MotionData(
+        int(float(row["timestamp"])),
+        [float(row["input_left_eye_position_x"]),
+         float(row["input_left_eye_position_y"]),
+         float(row["input_left_eye_position_z"])],
+        [float(row["input_right_eye_position_x"]),
+         float(row["input_right_eye_position_y"]),
+         float(row["input_right_eye_position_z"])],
+        [float(row["input_head_orientation_x"]),
+         float(row["input_head_orientation_y"]),
+         float(row["input_head_orientation_z"]),
+         float(row["input_head_orientation_w"])],
+        [float(row["input_head_acceleration_x"]),
+         float(row["input_head_acceleration_y"]),
+         float(row["input_head_acceleration_z"])],
+        [float(row["input_head_angular_vec_x"]),
+         float(row["input_head_angular_vec_y"]),
+         float(row["input_head_angular_vec_z"])],
+        [float(row["input_camera_projection_left"]),
+         float(row["input_camera_projection_top"]),
+         float(row["input_camera_projection_right"]),
+         float(row["input_camera_projection_bottom"])],
+        [float(row["input_right_hand_position_x"]),
+         float(row["input_right_hand_position_y"]),
+         float(row["input_right_hand_position_z"])],
+        [float(row["input_right_hand_orientation_x"]),
+         float(row["input_right_hand_orientation_y"]),
+         float(row["input_right_hand_orientation_z"]),
+         float(row["input_right_hand_orientation_w"])],
+        [float(row["input_right_hand_acceleration_x"]),
+         float(row["input_right_hand_acceleration_y"]),
+         float(row["input_right_hand_acceleration_z"])],
+        [float(row["input_right_hand_angular_vec_x"]),
+         float(row["input_right_hand_angular_vec_y"]),
+         float(row["input_right_hand_angular_vec_z"])],
+         0
+    )
+
+
+class SimulatedFrame:
+    def __init__(self, bytes):
+        self.bytes = bytes
+
+
+class SimulatedSocket:
+    # stands in for the zmq sockets of MotionDataTransport
+    def __init__(self):
+        self.frames = collections.deque()
+
+    async def recv(self, flags=0, copy=True):
+        return SimulatedFrame(self.frames.popleft())
+
+    async def poll(self, timeout=None, flags=0):
+        return 1 if len(self.frames) > 0 else 0
+
+    def send(self, data):
+        self.frames.append(data)
 
 
 class MotionPredictSimulator:
-    def __init__(self, module, input_motion_data, prediction_output):
+    def __init__(self, module, input_motion_data, prediction_output, time_range=None):
         self.module = module
         self.input_motion_data = input_motion_data
+        self.time_range = time_range
+        self.timings = {stage: [] for stage in STAGES}
         self.prediction_output = PredictionOutputWriter(
             prediction_output
         ) if prediction_output is not None else None
 
+    def read_rows(self):
+        if is_recording(self.input_motion_data):
+            start, stop = self.time_range if self.time_range is not None else (None, None)
+            yield from RecordingReader(self.input_motion_data).window(start, stop)
+            return
+
+        # also reads compressed csv and the segments of a rotated output
+        for row in read_csv_rows(self.input_motion_data):
+            if self.time_range is not None:
+                timestamp = float(row["timestamp"])
+                if self.time_range[0] is not None and timestamp < self.time_range[0]:
+                    continue
+                if self.time_range[1] is not None and timestamp >= self.time_range[1]:
+                    break
+
+            yield row
+
     def run(self):
-        with open(self.input_motion_data, newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                motion_data = MotionData(
-                    float(row["timestamp"]),
-                    [float(row["input_left_eye_position_x"]),
-                     float(row["input_left_eye_position_y"]),
-                     float(row["input_left_eye_position_z"])],
-                    [float(row["input_right_eye_position_x"]),
-                     float(row["input_right_eye_position_y"]),
-                     float(row["input_right_eye_position_z"])],
-                    [float(row["input_head_orientation_x"]),
-                     float(row["input_head_orientation_y"]),
-                     float(row["input_head_orientation_z"]),
-                     float(row["input_head_orientation_w"])],
-                    [float(row["input_head_acceleration_x"]),
-                     float(row["input_head_acceleration_y"]),
-                     float(row["input_head_acceleration_z"])],
-                    [float(row["input_head_angular_vec_x"]),
-                     float(row["input_head_angular_vec_y"]),
-                     float(row["input_head_angular_vec_z"])],
-                    [float(row["input_camera_projection_left"]),
-                     float(row["input_camera_projection_top"]),
-                     float(row["input_camera_projection_right"]),
-                     float(row["input_camera_projection_bottom"])],
-                    [float(row["input_right_hand_position_x"]),
-                     float(row["input_right_hand_position_y"]),
-                     float(row["input_right_hand_position_z"])],
-                    [float(row["input_right_hand_orientation_x"]),
-                     float(row["input_right_hand_orientation_y"]),
-                     float(row["input_right_hand_orientation_z"]),
-                     float(row["input_right_hand_orientation_w"])],
-                    [float(row["input_right_hand_acceleration_x"]),
-                     float(row["input_right_hand_acceleration_y"]),
-                     float(row["input_right_hand_acceleration_z"])],
-                    [float(row["input_right_hand_angular_vec_x"]),
-                     float(row["input_right_hand_angular_vec_y"]),
-                     float(row["input_right_hand_angular_vec_z"])],
-                     0
-                )
-
-                prediction_time, left_eye_position, right_eye_position, \
-                    head_orientation, camera_projection, \
-                    right_hand_position, right_hand_orientation = \
-                    self.module.predict(motion_data)
-                
-                predicted_data = PredictedData(motion_data.timestamp,
-                                               prediction_time,
-                                               left_eye_position,
-                                               right_eye_position,
-                                               head_orientation,
-                                               camera_projection,
-                                               right_hand_position,
-                                               right_hand_orientation,
-                                               0,
-                                               0,
-                                               0)
-
-                if self.prediction_output is not None:
-                    self.prediction_output.write(motion_data, predicted_data)
+        asyncio.run(self.simulate())
+        self.report()
+
+    async def simulate(self):
+        # recorded frames go through the same transport code as the live server
+        self.external_input = ExternalInput(self)
+        self.transport = MotionDataTransport(self)
+        self.transport.socket_recv = SimulatedSocket()
+        self.transport.socket_send = SimulatedSocket()
+
+        events = [(self.transport.socket_recv, 1)]
+        for row in self.read_rows():
+            self.transport.socket_recv.send(make_motion_data(row).pack())
+            await self.transport.process_events(events, self.external_input)
+
+            self.transport.socket_send.frames.clear()
+
+    def report(self):
+        for stage in STAGES:
+            timings = sorted(self.timings[stage])
+            if len(timings) == 0:
+                continue
+
+            print("{}: mean {:.1f} us, p50 {:.1f} us, p99 {:.1f} us, max {:.1f} us".format(
+                stage,
+                sum(timings) / len(timings) / 1000,
+                timings[len(timings) // 2] / 1000,
+                timings[min(len(timings) - 1, len(timings) * 99 // 100)] / 1000,
+                timings[-1] / 1000
+            ), flush=True)
+
+    # owner of the motion data transport, each hook marks the end of a stage
+    def record_traffic(self, channel, frame):
+        self.frame_start = self.stage_start = time.perf_counter_ns()
+
+    def end_stage(self, stage):
+        now = time.perf_counter_ns()
+        self.timings[stage].append(now - self.stage_start)
+        self.stage_start = now
+
+    def pre_predict_motion(self, session):
+        self.end_stage('decode')
+
+    async def predict_motion(self, motion_data):
+        result = self.module.predict(motion_data)
+        self.end_stage('predict')
+
+        return result
+
+    def predict_motion_batch(self, motion_data_list):
+        results = self.module.predict_batch(motion_data_list)
+        self.end_stage('predict')
+
+        return results
+
+    def post_predict_motion(self, session):
+        self.end_stage('build')
+
+    def prediction_sent(self, motion_data, predicted_data):
+        self.end_stage('send')
+
+        if self.prediction_output is not None:
+            self.prediction_output.write(motion_data, predicted_data)
+        self.end_stage('output')
+
+        self.timings['total'].append(self.stage_start - self.frame_start)
+
+    def external_input_received(self, input_data):
+        self.module.external_input_received(input_data)
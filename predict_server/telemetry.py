@@ -0,0 +1,73 @@
+import sys
+import getopt
+import struct
+import zmq
+
+from . import utils
+from ._transport import make_endpoint
+from ._telemetry import TOPIC_FEEDBACK, TOPIC_LATENCY, TOPIC_GAME_EVENT, TOPIC_MEMORY, LATENCY_FORMAT
+
+
+def decode_message(topic, payload):
+    if topic == TOPIC_LATENCY:
+        session, *latency = struct.unpack(LATENCY_FORMAT, payload)
+        return {'session': session, **dict(zip(utils.LATENCY_ITEMS, latency))}
+
+    import cbor2
+
+    return cbor2.loads(payload)
+
+
+def subscribe(topics=(TOPIC_FEEDBACK, TOPIC_LATENCY, TOPIC_GAME_EVENT, TOPIC_MEMORY),
+              host="localhost", port_input=5555, transport='tcp'):
+    if transport == 'tcp':
+        endpoint = "tcp://{}:{}".format(host, port_input + 4)
+    else:
+        endpoint = make_endpoint('ipc', port_input + 4)
+
+    socket = zmq.Context.instance().socket(zmq.SUB)
+    socket.connect(endpoint)
+    for topic in topics:
+        socket.setsockopt(zmq.SUBSCRIBE, topic)
+
+    try:
+        while True:
+            topic, payload = socket.recv_multipart()
+            yield topic, decode_message(topic, payload)
+    finally:
+        socket.close(linger=0)
+
+
+def main():
+    host = "localhost"
+    port = 5555
+    transport = 'tcp'
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "h:p:t:")
+    except getopt.GetoptError as err:
+        print(err)
+        sys.exit(1)
+
+    for opt, arg in opts:
+        if opt == "-h":
+            host = arg
+        elif opt == "-p":
+            port = int(arg)
+        elif opt == "-t":
+            transport = arg
+        else:
+            assert False, "unhandled option"
+
+    topics = [topic.encode('utf-8') for topic in args] if len(args) > 0 else \
+        [TOPIC_FEEDBACK, TOPIC_LATENCY, TOPIC_GAME_EVENT, TOPIC_MEMORY]
+
+    try:
+        for topic, message in subscribe(topics, host, port, transport):
+            print(topic.decode('utf-8'), message, flush=True)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
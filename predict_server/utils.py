@@ -1,6 +1,73 @@
 import math
-import numpy as np
-import quaternion
+
+# numpy and numpy-quaternion (which pulls in scipy) are imported on first use
+# so that starting a server does not pay for them unless metrics are written
+
+LATENCY_ITEMS = [
+    'overall_latency',
+    'gather_input_start_prediction',
+    'start_prediction_send_predicted',
+    'send_predicted_start_server_render',
+    'start_server_render_start_encode',
+    'start_encode_send_video',
+    'send_video_start_recv_video',
+    'start_recv_video_start_decode',
+    'start_decode_start_client_render',
+    'start_client_render_end_client_render'
+]
+
+
+def calc_latency_breakdown(feedback):
+    # in the order of LATENCY_ITEMS, from a feedback merged from client and server
+    overall_latency = feedback['endClientRender'] - feedback['gatherInput']
+
+    start_prediction_send_predicted = \
+        feedback['stopPrediction'] - feedback['startPrediction']
+    send_predicted_start_server_render = \
+        feedback['startServerRender'] - feedback['startSimulation']
+    start_server_render_start_encode = \
+        feedback['startEncode'] - feedback['startServerRender']
+    start_encode_send_video = \
+        feedback['sendVideo'] - feedback['startEncode']
+    start_recv_video_start_decode = \
+        feedback['startDecode'] - feedback['firstFrameReceived']
+    start_decode_start_client_render = \
+        feedback['startClientRender'] - feedback['startDecode']
+    start_client_render_end_client_render = \
+        feedback['endClientRender'] - feedback['startClientRender']
+
+    if 'clockOffset' in feedback:
+        # server clock = client clock + clockOffset, see ClockSync
+        gather_input_start_prediction = feedback['startSimulation'] - start_prediction_send_predicted - \
+            feedback['clockOffset'] - feedback['gatherInput']
+        send_video_start_recv_video = feedback['firstFrameReceived'] - \
+            (feedback['sendVideo'] - feedback['clockOffset'])
+    else:
+        rtt = overall_latency - (
+            start_prediction_send_predicted +
+            send_predicted_start_server_render +
+            start_server_render_start_encode +
+            start_encode_send_video +
+            start_recv_video_start_decode +
+            start_decode_start_client_render +
+            start_client_render_end_client_render
+        )
+
+        gather_input_start_prediction = send_video_start_recv_video = rtt / 2
+
+    return [
+        overall_latency,
+        gather_input_start_prediction,
+        start_prediction_send_predicted,
+        send_predicted_start_server_render,
+        start_server_render_start_encode,
+        start_encode_send_video,
+        send_video_start_recv_video,
+        start_recv_video_start_decode,
+        start_decode_start_client_render,
+        start_client_render_end_client_render
+    ]
+
 
 def make_other_eye_projection(projection):
     return [
@@ -20,7 +87,64 @@ def make_camera_projection(eye_projection, overfilling):
     ]
 
 
+def make_camera_projection_array(eye_projections, overfilling):
+    # eye projections as N x 4 (left, top, right, bottom), returns N x 4
+    import numpy as np
+
+    angles = np.arctan(np.asarray(eye_projections, dtype=np.float64).reshape(-1, 4))
+    angles += np.array([-overfilling[0], overfilling[1], overfilling[2], -overfilling[3]])
+
+    return np.tan(angles)
+
+
+class OverfilledProjection:
+    # eye projections only change with the headset or ipd, so the overfilled frusta of
+    # both eyes are computed once per left eye projection and looked up afterwards
+    def __init__(self, overfilling, max_entries=16):
+        self.overfilling = list(overfilling)
+        self.max_entries = max_entries
+        self.entries = {}
+        self.last_eye_projection = None
+        self.last_projections = None
+
+    def make(self, left_eye_projection):
+        # the returned projections are shared between frames and must not be modified
+        if left_eye_projection == self.last_eye_projection:
+            return self.last_projections
+
+        key = tuple(left_eye_projection)
+        projections = self.entries.get(key)
+        if projections is None:
+            if len(self.entries) >= self.max_entries:
+                self.entries.clear()
+
+            projections = self.entries[key] = (
+                make_camera_projection(left_eye_projection, self.overfilling),
+                make_camera_projection(make_other_eye_projection(left_eye_projection), self.overfilling)
+            )
+
+        self.last_eye_projection = list(left_eye_projection)
+        self.last_projections = projections
+        return projections
+
+
+def quat_to_euler_array(quaternions):
+    # quaternions as N x 4 (x, y, z, w), returns N x 3 (yaw, pitch, roll)
+    import numpy as np
+
+    x, y, z, w = np.asarray(quaternions, dtype=np.float64).reshape(-1, 4).T
+
+    yaw = np.arctan2(2 * (w * y - z * x), 1 - 2 * (y * y + z * z))
+    pitch = np.arctan2(2 * (w * x - y * z), 1 - 2 * (z * z + x * x))
+    roll = np.arcsin(np.clip(2 * (w * z + x * y), -1, 1))
+
+    return np.stack([yaw, pitch, roll], axis=1)
+
+
 def calc_optimal_projection(hmd_orientation, frame_orientation, eye_projection):
+    import numpy as np
+    import quaternion
+
     q_hmd = np.quaternion(
         hmd_orientation[0],
         hmd_orientation[1],
@@ -68,4 +192,61 @@ def calc_overhead(eye_projection, frame_projection):
     a_eye = (eye_projection[2] - eye_projection[0]) * (eye_projection[1] - eye_projection[3])
     a_frame = (frame_projection[2] - frame_projection[0]) * (frame_projection[1] - frame_projection[3])
 
-    return a_frame / a_eye - 1
\ No newline at end of file
+    return a_frame / a_eye - 1
+
+
+def calc_overheads(feedback):
+    # (optimal, actual) overhead of the rendered frame, averaged over both eyes
+    hmd_orientation = [
+        feedback['hmdOrientationW'],
+        -feedback['hmdOrientationX'],
+        -feedback['hmdOrientationY'],
+        feedback['hmdOrientationZ'],
+    ]
+    left_eye_projection = [
+        feedback['hmdProjectionL'],
+        feedback['hmdProjectionT'],
+        feedback['hmdProjectionR'],
+        feedback['hmdProjectionB']
+    ]
+    frame_orientation = [
+        feedback['frameOrientationW'],
+        -feedback['frameOrientationX'],
+        -feedback['frameOrientationY'],
+        feedback['frameOrientationZ']
+    ]
+    left_frame_projection = [
+        feedback['frameProjectionLL'],
+        feedback['frameProjectionLT'],
+        feedback['frameProjectionLR'],
+        feedback['frameProjectionLB']
+    ]
+    right_frame_projection = [
+        feedback['frameProjectionRL'],
+        feedback['frameProjectionRT'],
+        feedback['frameProjectionRR'],
+        feedback['frameProjectionRB']
+    ]
+
+    return calc_frame_overheads(
+        hmd_orientation, left_eye_projection, frame_orientation, left_frame_projection, right_frame_projection
+    )
+
+
+def calc_frame_overheads(hmd_orientation, left_eye_projection, frame_orientation,
+                         left_frame_projection, right_frame_projection):
+    # orientations as (w, x, y, z), see calc_overheads for how the feedback values map to them
+    left_optimal_overhead = calc_overhead(
+        left_eye_projection,
+        calc_optimal_projection(hmd_orientation, frame_orientation, left_eye_projection)
+    )
+    left_actual_overhead = calc_overhead(left_eye_projection, left_frame_projection)
+
+    right_eye_projection = make_other_eye_projection(left_eye_projection)
+    right_optimal_overhead = calc_overhead(
+        right_eye_projection,
+        calc_optimal_projection(hmd_orientation, frame_orientation, right_eye_projection)
+    )
+    right_actual_overhead = calc_overhead(right_eye_projection, right_frame_projection)
+
+    return (left_optimal_overhead + right_optimal_overhead) / 2, (left_actual_overhead + right_actual_overhead) / 2
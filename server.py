@@ -2,8 +2,7 @@ from math import radians
 import sys
 import getopt
 
-from numpy import deg2rad
-from predict_server import PredictModule, MotionPredictServer
+from predict_server import PredictModule, MotionPredictServer, PredictionCache, LowLatencyMode, load_module
 from predict_server.simulator import MotionPredictSimulator
 import predict_server.utils
 # from predict_server import BufferedNoPrediction
@@ -14,16 +13,29 @@ class App(PredictModule):
         # self.prediction = BufferedNoPrediction(20, 100)
         self.sum_overall_latency = 0
         self.count_overall_latency = 0
-        pass
+
+        # overfilling delta in radian (left, top, right, bottom)
+        self.projection = predict_server.utils.OverfilledProjection(
+            [radians(10), radians(10), radians(10), radians(10)]
+        )
 
     def parse_command_args(self):
         port = 5555
         feedback = 5554
         input_file = output = metric_output = game_event_output = None
         accept_client_buttons = False
+        time_range = None
+        evaluate = False
+        server_options = {}
+        low_latency = {}
         
         try:
-            opts, _args = getopt.getopt(sys.argv[1:], "p:f:m:o:i:g:", ["accept-client-buttons"])
+            opts, _args = getopt.getopt(sys.argv[1:], "p:f:m:o:i:g:t:r:", [
+                "accept-client-buttons", "range=", "evaluate", "control", "swap-budget=", "deadline=",
+                "shadow=", "shadow-output=", "batch=", "batch-window=", "extended-inputs", "cache", "cache-tolerance=", "telemetry", "profile=", "profile-output=", "trace=",
+                "rotate-size=", "rotate-interval=", "compress=", "retain=",
+                "low-latency", "cpus=", "priority=", "spin=", "summary=", "summary-interval=", "memory=", "memory-output=", "control-host="
+            ])
         except getopt.GetoptError as err:
             print(err)
             sys.exit(1)
@@ -41,21 +53,94 @@ class App(PredictModule):
                 metric_output = arg
             elif opt == "-g":
                 game_event_output = arg
+            elif opt == "-t":
+                server_options['transport'] = arg
+            elif opt == "-r":
+                server_options['traffic_capture'] = arg
             elif opt == "--accept-client-buttons":
                 accept_client_buttons = True
+            elif opt == "--control":
+                server_options['control'] = True
+            elif opt == "--control-host":
+                # the control socket imports whatever module it is asked to, keep it local unless needed
+                server_options['control_host'] = arg
+            elif opt == "--swap-budget":
+                server_options['swap_latency_budget'] = float(arg)
+            elif opt == "--deadline":
+                server_options['prediction_deadline'] = float(arg)
+            elif opt == "--shadow":
+                server_options.setdefault('shadow_modules', []).append(load_module(arg))
+            elif opt == "--shadow-output":
+                server_options['shadow_output'] = arg
+            elif opt == "--batch":
+                server_options['batch_size'] = int(arg)
+            elif opt == "--batch-window":
+                server_options['batch_window'] = float(arg)
+            elif opt == "--cache":
+                server_options.setdefault('prediction_cache', PredictionCache())
+            elif opt == "--cache-tolerance":
+                # position, orientation, projection[, acceleration and angular velocity]
+                tolerances = [float(value) for value in arg.split(",")]
+                server_options['prediction_cache'] = PredictionCache(64, *tolerances)
+            elif opt == "--profile":
+                server_options['profile_threshold'] = float(arg)
+            elif opt == "--profile-output":
+                server_options['profile_output'] = arg
+            elif opt == "--summary":
+                server_options['summary_output'] = arg
+            elif opt == "--summary-interval":
+                server_options['summary_interval'] = float(arg)
+            elif opt == "--memory":
+                server_options['memory_interval'] = float(arg)
+            elif opt == "--memory-output":
+                server_options['memory_output'] = arg
+            elif opt == "--trace":
+                server_options['trace_output'] = arg
+            elif opt == "--rotate-size":
+                server_options.setdefault('output_rotation', {})['max_bytes'] = int(float(arg) * 1024 * 1024)
+            elif opt == "--rotate-interval":
+                server_options.setdefault('output_rotation', {})['max_seconds'] = float(arg)
+            elif opt == "--compress":
+                server_options.setdefault('output_rotation', {})['compression'] = arg
+            elif opt == "--retain":
+                server_options.setdefault('output_rotation', {})['retention'] = int(arg)
+            elif opt == "--low-latency":
+                low_latency.setdefault('spin_time', 0.5)
+            elif opt == "--cpus":
+                low_latency['cpus'] = [int(cpu) for cpu in arg.split(",")]
+            elif opt == "--priority":
+                low_latency['priority'] = int(arg)
+            elif opt == "--spin":
+                low_latency['spin_time'] = float(arg)
+            elif opt == "--telemetry":
+                server_options['telemetry'] = True
+            elif opt == "--extended-inputs":
+                server_options['extended_inputs'] = True
+            elif opt == "--evaluate":
+                evaluate = True
+            elif opt == "--range":
+                # start:stop in input timestamps, either end may be omitted
+                start, stop = arg.split(":")
+                time_range = (int(start) if start else None, int(stop) if stop else None)
             else:
                 assert False, "unhandled option"
                 
-        return port, feedback, input_file, output, metric_output, game_event_output, accept_client_buttons
+        if len(low_latency) > 0:
+            server_options['low_latency'] = LowLatencyMode(**low_latency)
+
+        return port, feedback, input_file, output, metric_output, game_event_output, accept_client_buttons, \
+               server_options, time_range, evaluate
 
     def run(self):
-        port_input, port_feedback, input_file, output, metric_output, game_event_output, accept_client_buttons = \
+        port_input, port_feedback, input_file, output, metric_output, game_event_output, accept_client_buttons, \
+            server_options, time_range, evaluate = \
             self.parse_command_args()
         if input_file is None:
             assert(port_input is not None and port_feedback is not None)
             
             server = MotionPredictServer(
-                self, port_input, port_feedback, output, metric_output, game_event_output, accept_client_buttons
+                self, port_input, port_feedback, output, metric_output, game_event_output, accept_client_buttons,
+                **server_options
             )
 
             server.run()
@@ -63,12 +148,19 @@ class App(PredictModule):
         else:
             assert(output is not None)
 
-            simulator = MotionPredictSimulator(self, input_file, output)
+            simulator = MotionPredictSimulator(self, input_file, output, time_range)
 
             try:                
                 simulator.run()
             except KeyboardInterrupt:
                 pass
+            finally:
+                simulator.prediction_output.close()
+
+            if evaluate:
+                # the evaluator needs numpy, only load it for offline runs
+                from predict_server.evaluator import PredictionEvaluator, print_evaluation
+                print_evaluation(PredictionEvaluator(output).evaluate())
     
     # implements PredictModule
     def predict(self, motion_data):
@@ -81,14 +173,8 @@ class App(PredictModule):
         predicted_right_eye_pos = motion_data.right_eye_position
         predicted_head_orientation = motion_data.head_orientation
 
-        # overfilling delta in radian (left, top, right, bottom)
-        overfilling = [radians(10), radians(10), radians(10), radians(10)]
-
-        left_eye_projection = motion_data.camera_projection
-        predicted_left_camera_projection = predict_server.utils.make_camera_projection(left_eye_projection, overfilling)
-
-        right_eye_projection = predict_server.utils.make_other_eye_projection(left_eye_projection)
-        predicted_right_camera_projection = predict_server.utils.make_camera_projection(right_eye_projection, overfilling)
+        predicted_left_camera_projection, predicted_right_camera_projection = \
+            self.projection.make(motion_data.camera_projection)
 
         predicted_right_hand_pos = motion_data.right_hand_position
         predicted_right_hand_ori = motion_data.right_hand_orientation